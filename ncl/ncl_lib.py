@@ -1,64 +1,306 @@
 """ Description here
 """
 
+import os
 import re
-import sqlite3
+import array
+import bisect
+import collections
+import marshal
 import logging
+import math
 import signal
 import sys
-import traceback
-import argparse
+import time
 import random
-import yaml
+import functools
+import weakref
+
+# yaml, sqlite3, numpy and the modules of the command line, workers, checkpoints and
+# match files are imported where they are used, importing ncl_lib stays cheap
 
 LOGGER = logging.getLogger(__name__)
-LOGGER.setLevel(logging.DEBUG)
+# the command line logs to the screen, see setup_logging, embedding code decides
+LOGGER.addHandler(logging.NullHandler())
+
+# seconds an import of ncl_lib may take, see the benchmark report
+IMPORT_BUDGET = 0.1
+
+
+def setup_logging(level=logging.DEBUG):
+    """ Log to the screen, for the command line
+
+    :param level: logging level
+    :return: the handler
+    """
+    handler = logging.StreamHandler()
+    handler.setLevel(level)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - '
+                                           '%(message)s'))
+    LOGGER.addHandler(handler)
+    LOGGER.setLevel(level)
+    return handler
+
+
+@functools.lru_cache(maxsize=None)
+def _numpy():
+    """ numpy is optional, and the slowest import by far
+
+    :return: numpy module, None if it is not installed
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+@functools.lru_cache(maxsize=None)
+def _yaml_loader():
+    """
+
+    :return: libyaml parser if PyYAML was built with it, the pure Python one otherwise
+    """
+    import yaml
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# boundaries at which pending hit counts are written to the distribution DBs
+FLUSH_BOUNDARIES = ("day", "season", "exit")
 
-SCREEN_HANDLER = logging.StreamHandler()
-SCREEN_HANDLER.setLevel(logging.DEBUG)
+# match engines, see Schedule.play
+ENGINES = ("match", "batch")
 
-FORMATTER = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-SCREEN_HANDLER.setFormatter(FORMATTER)
+# formats of the matches written by MatchWriter
+MATCH_FORMATS = ("jsonl", "csv")
 
-LOGGER.addHandler(SCREEN_HANDLER)
+# (first minute - 1, minutes) of the periods played with each distribution DB
+PERIODS = {"regular_time": (0, 90), "extra_time": (90, 30)}
 
+# parsed league files are cached next to them, see read_league
+LEAGUE_CACHE_SUFFIX = ".cache"
+LEAGUE_CACHE_VERSION = 1
 
-def load_league(league_file):
+# a match played, see League.matches; penalties are None without a shootout
+MatchRecord = collections.namedtuple("MatchRecord", (
+    "season", "phase", "day", "home", "away", "home_goals", "away_goals", "extra_time",
+    "home_penalties", "away_penalties"))
+
+
+def read_league(league_file, cache=True):
+    """ Parse a league yaml file, or read it from its cache if the file did not change.
+    The cache is a marshal dump next to the file, keyed by the hash of its content.
+
+    :param league_file: yaml file with all teams by conference and division
+    :param cache: use and update the cache
+    :return: dict of the yaml file
+    """
+    import yaml
+    import hashlib
+    with open(league_file, "rb") as stream:
+        content = stream.read()
+    if not cache:
+        return yaml.load(content, Loader=_yaml_loader())
+    key = (LEAGUE_CACHE_VERSION, hashlib.sha1(content).hexdigest())
+    cache_file = league_file + LEAGUE_CACHE_SUFFIX
+    try:
+        with open(cache_file, "rb") as stream:
+            cached_key, league_dict = marshal.load(stream)
+        if tuple(cached_key) == key:
+            return league_dict
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    league_dict = yaml.load(content, Loader=_yaml_loader())
+    # workers may write it at the same time, each one replaces it with a whole file
+    tmp_file = "{0}.{1}.tmp".format(cache_file, os.getpid())
+    try:
+        with open(tmp_file, "wb") as stream:
+            marshal.dump((key, league_dict), stream)
+        os.replace(tmp_file, cache_file)
+    except (OSError, ValueError) as err:
+        LOGGER.debug(msg="League cache {0} not written: {1}".format(cache_file, err))
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return league_dict
+
+
+def load_league(league_file, db_dir=None, cache=True):
     """ Read league yaml file and creates conferences, divisions, teams and databases
 
     :param league_file: yaml file with all teams by conference and division
+    :param db_dir: directory for the database files, current directory if None
+    :param cache: use the cache of the parsed file, see read_league
     :return:
     """
 
-    with open(league_file, "r") as stream:
-        league_dict = yaml.load(stream)
-        league_name = list(league_dict.keys())[0]
-        LOGGER.info(msg="League: {0}".format(league_name))
-        league_obj = League(league_name)
-        league_obj.playoffs = league_dict[league_name].get('playoffs', False)
-        conf_dict = league_dict[league_name].get('conferences')
-        for conf_name in conf_dict.keys():
-            conf_obj = league_obj.add_conference(conf_name)
-            div_dict = conf_dict[conf_name].get('divisions')
-            for div_name in div_dict.keys():
-                div_obj = conf_obj.add_division(div_name)
-                team_dict = div_dict[div_name].get('teams')
-                for t_name in team_dict.keys():
-                    team_obj = div_obj.add_team(t_name)
-                    strength = team_dict[t_name].get('strength')
-                    # make it a property
-                    team_obj.strength = strength
-        db_dict = league_dict[league_name].get('databases')
+    league_dict = read_league(league_file, cache)
+    league_name = list(league_dict.keys())[0]
+    LOGGER.info(msg="League: {0}".format(league_name))
+    league_obj = League(league_name, db_dir)
+    league_obj.league_file = league_file
+    league_obj.playoffs = league_dict[league_name].get('playoffs', False)
+    conf_dict = league_dict[league_name].get('conferences')
+    for conf_name in conf_dict.keys():
+        conf_obj = league_obj.add_conference(conf_name)
+        div_dict = conf_dict[conf_name].get('divisions')
+        for div_name in div_dict.keys():
+            div_obj = conf_obj.add_division(div_name)
+            team_dict = div_dict[div_name].get('teams')
+            for t_name in team_dict.keys():
+                team_obj = div_obj.add_team(t_name)
+                strength = team_dict[t_name].get('strength')
+                # make it a property
+                team_obj.strength = strength
+    db_dict = league_dict[league_name].get('databases')
+    try:
         for db_name in db_dict.keys():
-            db_file_name = re.sub(r' ', '_', db_name.lower())
-            db_file_name += ".db"
-            LOGGER.info(msg="DB name: {0}".format(db_file_name))
-            db_obj = league_obj.create_distribution_db(db_file_name)
+            distr_name = re.sub(r' ', '_', db_name.lower())
             prob_dict = db_dict[db_name].get('probabilities')
-            for score, prob in prob_dict.items():
-                db_obj.add_score(score, prob)
+            db_obj = league_obj.create_distribution_db(distr_name, prob_dict)
+            LOGGER.info(msg="DB name: {0}".format(db_obj.db_name))
+    except BaseException:
+        # DBs already loaded are free for the next attempt
+        league_obj.close()
+        raise
+
+    return league_obj
+
+
+@functools.lru_cache(maxsize=None)
+def round_robin_template(count):
+    """ Fixtures of a double round robin between count teams (circle method), computed once
+    per team count and shared by all divisions and seasons
+
+    :param count: number of teams
+    :return: tuple of days, each one a tuple of (home team index, away team index)
+    """
+    first_half = []
+    rotating_table = {}
+    for team_idx in range(0, count):
+        rotating_table[team_idx + 1] = team_idx
+    day = 1
+    while day <= count - 1:
+        pairs = []
+        match = 1
+        while match <= count / 2:
+            if match == 1:
+                team1 = rotating_table[match]
+                team2 = rotating_table[match + 1]
+            else:
+                team1 = rotating_table[match + 1]
+                team2 = rotating_table[count - match + 2]
+            pairs.append((team1, team2))
+            match += 1
+        first_half.append(tuple(pairs))
+        day += 1
+        # rotate table
+        curr_val = 0
+        for entry in rotating_table.keys():
+            if entry == 2:
+                curr_val = rotating_table[entry]
+                rotating_table[entry] = rotating_table[count]
+            elif entry > 2:
+                stored_val = rotating_table[entry]
+                rotating_table[entry] = curr_val
+                curr_val = stored_val
+    # second half of the season, same fixtures with home and away swapped
+    second_half = [tuple((team2, team1) for team1, team2 in pairs) for pairs in first_half]
+    return tuple(first_half + second_half)
+
+
+def penalty_shootout(rng=random):
+    """ Penalty kicks until there is a winner, each kick scores with probability 1/2.
+    Teams alternate for 5 kicks each, stopping as soon as one cannot be caught, then play
+    sudden death rounds: the number of rounds is geometric, tied rounds add a goal to both
+    teams or to none, the last round a goal to the winner only.
+
+    :param rng: random number generator, random module or random.Random
+    :return: (home, away) kicks scored
+    """
+    kicks = rng.getrandbits(10)
+    home = away = 0
+    for kick in range(10):
+        if kick % 2:
+            away += (kicks >> kick) & 1
+        else:
+            home += (kicks >> kick) & 1
+        home_left = 4 - kick // 2
+        away_left = 5 - (kick + 1) // 2
+        if home > away + away_left or away > home + home_left:
+            return home, away
+    rounds = 1 + int(math.log(1.0 - rng.random()) / math.log(0.5))
+    both = bin(rng.getrandbits(rounds - 1)).count("1") if rounds > 1 else 0
+    if rng.getrandbits(1):
+        return home + both + 1, away + both
+    return home + both, away + both + 1
+
+
+def parse_score(score):
+    """ Scores are strings in the league files and DBs only, matches use integer pairs
+
+    :param score: "home-away", e.g. "2-1"
+    :return: (home goals, away goals)
+    """
+    home, sep, away = score.partition("-")
+    if not sep or not home.strip().isdigit() or not away.strip().isdigit():
+        raise RuntimeError("Error: invalid score {0}".format(score))
+    return int(home), int(away)
+
+
+def format_score(score):
+    """
+
+    :param score: (home goals, away goals)
+    :return: "home-away"
+    """
+    return "{0}-{1}".format(*score)
+
+
+def goal_timeline(periods, rng=random):
+    """ Minute of each goal, drawn uniformly in its period. Goals of both teams are drawn
+    in a fixed order and sorted, so the order of the teams is random too.
+
+    :param periods: list of (offset, minutes, home goals, away goals), see Score.periods
+    :param rng: random number generator, random module or random.Random
+    :return: list of (minute, side) sorted by minute, side 0 for home and 1 for away
+    """
+    goals = []
+    for offset, minutes, home, away in periods:
+        period = [(rng.randint(offset + 1, offset + minutes), 0) for _ in range(home)]
+        period.extend((rng.randint(offset + 1, offset + minutes), 1) for _ in range(away))
+        period.sort()
+        goals.extend(period)
+    return goals
+
 
-        return league_obj
+def _greater(strength1, strength2, factor):
+    """
+
+    :return: probability that uniform(0, strength1) > factor * uniform(0, strength2)
+    """
+    if strength1 <= 0:
+        return 0.0
+    if strength2 <= 0:
+        return 1.0
+    bound = factor * strength2
+    if strength1 <= bound:
+        return strength1 / (2 * bound)
+    return 1 - bound / (2 * strength1)
+
+
+def outcome_probabilities(home_strength, away_strength, home_advantage=True):
+    """ Exact probabilities of the results of Match.play: the home team wins if its
+    adjusted strength is more than twice the away one, loses if it is less than half
+
+    :param home_strength:
+    :param away_strength:
+    :param home_advantage: whether home team strength doubles
+    :return: (home, draw, away) probabilities
+    """
+    if home_advantage:
+        home_strength *= 2
+    home = _greater(home_strength, away_strength, 2)
+    away = _greater(away_strength, home_strength, 2)
+    return home, 1 - home - away, away
 
 
 class DistributionDB(object):
@@ -72,24 +314,109 @@ class DistributionDB(object):
         :param db_name:
         """
 
+        import sqlite3
         # supply the special name :memory: to create a database in RAM
+        self.db_name = db_name
+        # the connection stays open, sqlite keeps its statements prepared
         self.conn = sqlite3.connect(db_name)
         self.cursor = self.conn.cursor()
         self.cumulative_total = 0
+        # in-memory copy of the distribution as (home, away) pairs, see load()
+        self.scores = []
+        self.cumulative = []
+        # same, conditioned on the outcome: {"home"|"away"|"draw": (scores, cumulative)}
+        self.outcomes = {}
+        # number of scores sampled, compared to hits it gives the retries per match
+        self.samples = 0
+        # {(home, away): hits} not yet written to the DB, see flush()
+        self.pending_hits = {}
+
+    def __getstate__(self):
+        """ Snapshot without the connection, with the probabilities and all hits so far
+
+        :return:
+        """
+        self.cursor.execute('''SELECT score, probability FROM scores ORDER BY cumulative''')
+        probabilities = self.cursor.fetchall()
+        hits = {parse_score(score): self.get_hit(score) for score, _ in probabilities}
+        return {"db_name": self.db_name, "probabilities": probabilities,
+                "hits": {score: hit for score, hit in hits.items() if hit},
+                "samples": self.samples}
+
+    def __setstate__(self, state):
+        """ Reopen the DB, reloading it if it is missing or changed, and restore the hits
+
+        :param state: see __getstate__
+        :return:
+        """
+        self.__init__(state["db_name"])
+        self.bulk_load(dict(state["probabilities"]))
+        self.pending_hits = dict(state["hits"])
+        self.samples = state["samples"]
 
     def create_table(self):
         """
 
         :return:
         """
+        import sqlite3
         try:
             self.cursor.execute('''DROP TABLE if exists scores''')
+            self.cursor.execute('''DROP TABLE if exists info''')
         except sqlite3.OperationalError as err:
             raise RuntimeError("Error: %s" % str(err))
         self.cursor.execute('''CREATE TABLE scores(score TEXT PRIMARY KEY,
             probability FLOAT, cumulative FLOAT, hit INT)''')
+        self.cursor.execute('''CREATE TABLE info(key TEXT PRIMARY KEY, value TEXT)''')
         self.conn.commit()
 
+    def get_digest(self):
+        """
+
+        :return: hash of the probabilities loaded by bulk_load, None if there is none
+        """
+        import sqlite3
+        try:
+            self.cursor.execute('''SELECT value FROM info WHERE key = 'digest' ''')
+        except sqlite3.OperationalError:
+            return None
+        record = self.cursor.fetchone()
+        return record[0] if record else None
+
+    def bulk_load(self, probabilities):
+        """ Load all scores in a single transaction and load them in memory.
+        The DB is left as is, with hits reset, if it already holds the same probabilities.
+
+        :param probabilities: {score: probability}, in the order of the cumulative distribution
+        :return: whether the scores table was (re)created
+        """
+        import hashlib
+        total = sum(probabilities.values())
+        if abs(total - 1.0) > 1e-6:
+            raise RuntimeError("Error: probabilities in {0} add up "
+                               "to {1}".format(self.db_name, total))
+        records = []
+        cumulative = 0
+        for score, prob in probabilities.items():
+            cumulative += prob
+            records.append((score, prob, cumulative, 0))
+        digest = hashlib.sha1(repr(records).encode()).hexdigest()
+        self.cumulative_total = cumulative
+        self.pending_hits = {}
+        if self.get_digest() == digest:
+            with self.conn:
+                self.conn.execute('''UPDATE scores SET hit = 0''')
+            self.load()
+            return False
+        self.create_table()
+        with self.conn:
+            self.conn.executemany('''INSERT INTO scores(score, probability, cumulative, hit)
+                VALUES(?,?,?,?)''', records)
+            self.conn.execute('''CREATE INDEX cumulative_idx ON scores(cumulative)''')
+            self.conn.execute('''INSERT INTO info(key, value) VALUES('digest', ?)''', (digest,))
+        self.load()
+        return True
+
     def add_score(self, score, prob):
         """
 
@@ -102,11 +429,78 @@ class DistributionDB(object):
             VALUES(?,?,?,?)''', (score, prob, self.cumulative_total, 0))
         self.conn.commit()
 
+    def load(self):
+        """ Load the distribution in memory, sorted by cumulative probability,
+        so that sampling a score does not need to query the DB. Scores are parsed here
+        once, into (home, away) pairs grouped by outcome.
+
+        :return:
+        """
+        self.cursor.execute('''SELECT score, probability, cumulative FROM scores
+            ORDER BY cumulative''')
+        records = [(parse_score(score), prob, cumulative)
+                   for score, prob, cumulative in self.cursor.fetchall()]
+        self.scores = [record[0] for record in records]
+        self.cumulative = [record[2] for record in records]
+        by_outcome = {}
+        for score, prob, _ in records:
+            by_outcome.setdefault(Score.get_winner(score), []).append((score, prob))
+        self.outcomes = {}
+        for result, records in by_outcome.items():
+            total = sum(prob for _, prob in records)
+            cumulative = []
+            running = 0
+            for _, prob in records:
+                running += prob
+                cumulative.append(running / total)
+            self.outcomes[result] = ([score for score, _ in records], cumulative)
+
+    def sample(self, val, result=None):
+        """ In-memory equivalent of get_score, uses binary search on the cumulative array
+
+        :param val: cumulative distribution
+        :param result: "home", "away" or "draw" to sample only scores with that outcome
+        :return: (home, away)
+        """
+        self.samples += 1
+        if result is None:
+            scores, cumulative = self.scores, self.cumulative
+        elif result in self.outcomes:
+            scores, cumulative = self.outcomes[result]
+        else:
+            raise RuntimeError("Error: no {0} score in distribution".format(result))
+        idx = bisect.bisect_right(cumulative, val)
+        # rounding may leave the last cumulative value slightly below 1
+        return scores[min(idx, len(scores) - 1)]
+
+    def record(self, score, hits=1):
+        """ Count a hit for score in memory, the DB is updated by flush()
+
+        :param score: (home, away)
+        :param hits: number of hits
+        :return:
+        """
+        self.pending_hits[score] = self.pending_hits.get(score, 0) + hits
+
+    def flush(self):
+        """ Write pending hit counts to the DB in a single transaction
+
+        :return:
+        """
+        if not self.pending_hits:
+            return
+        with self.conn:
+            self.conn.executemany('''UPDATE scores SET hit = hit + ? WHERE score = ?''',
+                                  [(hit, format_score(score))
+                                   for score, hit in self.pending_hits.items()])
+        self.pending_hits = {}
+
     def close(self):
         """
 
         :return:
         """
+        self.flush()
         self.conn.close()
 
     def destroy(self):
@@ -114,7 +508,9 @@ class DistributionDB(object):
 
         :return:
         """
+        self.pending_hits = {}
         self.cursor.execute('''DROP TABLE if exists scores''')
+        self.cursor.execute('''DROP TABLE if exists info''')
         self.conn.commit()
         self.conn.close()
 
@@ -129,13 +525,16 @@ class DistributionDB(object):
         away = 0
         self.cursor.execute("SELECT * FROM scores")
         records = self.cursor.fetchall()
+        # include hits not flushed yet
+        records = [record[:3] + (record[3] + self.pending_hits.get(parse_score(record[0]), 0),)
+                   for record in records]
         for record in records:
             actual = record[3]
             total += actual
-            res_obj = re.search(r'(\d)-(\d)', record[0])
-            if int(res_obj.group(1)) == int(res_obj.group(2)):
+            home_goals, away_goals = parse_score(record[0])
+            if home_goals == away_goals:
                 draw += actual
-            elif int(res_obj.group(1)) > int(res_obj.group(2)):
+            elif home_goals > away_goals:
                 home += actual
             else:
                 away += actual
@@ -154,16 +553,17 @@ class DistributionDB(object):
             LOGGER.debug(msg="Home wins {:2.2f}% (50%)".format(home_wins*100))
             LOGGER.debug(msg="Away wins {:2.2f}% (25%)".format(away_wins*100))
             LOGGER.debug(msg="Draws {:2.2f}% (25%)".format(draws*100))
+            LOGGER.debug(msg="Scores sampled per match {:.2f}".format(float(self.samples)/total))
             LOGGER.debug("")
 
     def get_hit(self, val):
         """
 
-        :param val:
+        :param val: score string, as in the DB
         :return:
         """""
         self.cursor.execute('''SELECT hit FROM scores WHERE score = ?''', (val,))
-        return self.cursor.fetchone()[0]
+        return self.cursor.fetchone()[0] + self.pending_hits.get(parse_score(val), 0)
 
     def get_score(self, val):
         """
@@ -194,372 +594,397 @@ class DistributionDB(object):
         self.conn.commit()
 
 
-class Association:
+class DistributionRegistry(object):
     """
-    Description here
+    Distribution DBs of a league by name ("regular_time", "extra_time"). Each DB keeps
+    one connection open for the whole run. Leagues never share a DB file: while a league
+    of this process uses one, other leagues get their own file next to it.
     """
 
-    def __init__(self, name):
+    # {DB file: registry using it} in this process, the files of a registry that is no
+    # longer reachable are free again
+    open_paths = weakref.WeakValueDictionary()
+
+    # whether registries still open are closed at exit, see _close_registries
+    exit_hook = False
+
+    def __init__(self, db_dir=None, prefix=""):
         """
 
-        :param name:
+        :param db_dir: directory for the database files, current directory if None
+        :param prefix: prefix of the database file names
         """
-        self.name = name
-        self.teams = []
-        self.champion = None
-        self.schedule = Schedule()
-        signal.signal(signal.SIGPIPE, self._signal_handler)
-        signal.signal(signal.SIGINT, self._signal_handler)
+        self.db_dir = db_dir
+        self.prefix = prefix
+        self.distributions = {}
+        # files of this registry only, removed by destroy()
+        self.private_paths = set()
 
-    def destroy(self):
+    def __getitem__(self, name):
+        return self.distributions[name]
+
+    def __contains__(self, name):
+        return name in self.distributions
+
+    def items(self):
         """
 
         :return:
         """
-        LOGGER.info("stub for destroy")
+        return self.distributions.items()
 
-    @staticmethod
-    def _team_sort(teams):
+    def values(self):
         """
 
-        :param teams:
         :return:
         """
-        sorted_teams = []
-        for team in teams:
-            if len(sorted_teams) > 0:
-                found = 0
-                for pos in sorted_teams:
-                    if team.points >= pos.points:
-                        pos_index = sorted_teams.index(pos)
-                        sorted_teams.insert(pos_index, team)
-                        found = 1
-                        break
-                if found == 0:
-                    sorted_teams.append(team)
-            else:
-                sorted_teams.append(team)
-        return sorted_teams
+        return self.distributions.values()
 
-    def _signal_handler(self, signum, frame):
+    def path(self, name):
         """
 
-        :param signum: signal number
-        :param frame: frame with the stack
+        :param name: distribution name
+        :return: DB file name
         """
-        LOGGER.warning(msg="Interrupt handler called: {0}".format(signum))
-        traceback.print_stack(frame)
-        self.destroy()
-        sys.exit(0)
-
-
-class League(Association):
-    """
-    Description here
-    """
+        return os.path.join(self.db_dir or "", self.prefix + name + ".db")
 
-    def __init__(self, name):
+    def create(self, name):
         """
 
-        :param name:
+        :param name: distribution name
+        :return: DistributionDB
         """
-        super().__init__(name)
-        self.distributions = {}
-        self.conferences = {}
-        self.playoffs = False
-        self.final_series = []
-        self.series_length = 1
+        new_db = DistributionDB(self._reserve(os.path.abspath(self.path(name))))
+        self.distributions[name] = new_db
+        return new_db
 
-    def add_conference(self, name):
+    def _reserve(self, path):
         """
 
-        :param name:
-        :return:
+        :param path: DB file
+        :return: path, or a new file in the same directory if another league uses it
         """
-        LOGGER.debug(msg="Adding conference {0} ...".format(name))
-        new_conf = Conference(name)
-        self.conferences[name] = new_conf
-        return new_conf
-
-    def create_distribution_db(self, name):
+        if path in self.open_paths:
+            import tempfile
+            root, ext = os.path.splitext(path)
+            handle, path = tempfile.mkstemp(suffix=ext, prefix=os.path.basename(root) + "_",
+                                            dir=os.path.dirname(path))
+            os.close(handle)
+            self.private_paths.add(path)
+        self.open_paths[path] = self
+        if not DistributionRegistry.exit_hook:
+            import atexit
+            atexit.register(_close_registries)
+            DistributionRegistry.exit_hook = True
+        return path
+
+    def _release(self, path):
         """
 
-        :param name:
+        :param path: DB file
         :return:
         """
-        new_db = DistributionDB(name)
-        self.distributions[name] = new_db
-        new_db.create_table()
-        return new_db
+        if self.open_paths.get(path) is self:
+            del self.open_paths[path]
+        if path in self.private_paths:
+            self.private_paths.discard(path)
+            os.remove(path)
 
-    def destroy(self):
-        """
+    def release(self, name):
+        """ Close a DB and free its file for other leagues, e.g. when it failed to load
 
+        :param name: distribution name
         :return:
         """
-        for db_obj in self.distributions.values():
-            db_obj.destroy()
+        db_obj = self.distributions.pop(name)
+        db_obj.close()
+        self._release(db_obj.db_name)
 
-    def display(self):
-        """
+    def __getstate__(self):
+        """ DBs are reopened by __setstate__, once their files are reserved
 
         :return:
         """
-        LOGGER.debug("\n")
-        LOGGER.debug(msg="League {0} has {1} "
-                     "conferences:".format(self.name,
-                                           len(list(self.conferences.keys()))))
-        for conf_name, conf in self.conferences.items():
-            LOGGER.debug(msg="\t - Conference {0}".format(conf_name))
-        for conf in self.conferences.values():
-            conf.display()
+        state = dict(self.__dict__)
+        state["distributions"] = {name: db_obj.__getstate__()
+                                  for name, db_obj in self.distributions.items()}
+        return state
 
-    def initialize(self):
-        """
+    def __setstate__(self, state):
+        """ DBs of a league restored from a snapshot are open in this process too, in
+        their own files if another league uses the original ones
 
+        :param state: see __getstate__
         :return:
         """
-        for conf in self.conferences.values():
-            conf.initialize()
+        self.__dict__.update(state)
+        self.private_paths = set()
+        self.distributions = {}
+        for name, db_state in state["distributions"].items():
+            new_db = DistributionDB.__new__(DistributionDB)
+            new_db.__setstate__(dict(db_state, db_name=self._reserve(db_state["db_name"])))
+            self.distributions[name] = new_db
 
-    def setup_final(self):
+    def flush(self):
         """
 
         :return:
         """
-        self.schedule.reset()
-        for conf in self.conferences.values():
-            self.teams.append(conf.champion)
-        self.teams = self._team_sort(self.teams)
-        for team in self.teams:
-            LOGGER.info(msg="Team {0} made the final".format(team.name))
-        for idx in range(0, int(len(self.teams)/2)):
-            team1 = self.teams[idx]
-            team2 = self.teams[len(self.teams) - 1 - idx]
-            new_series = Series(team1, team2, self.series_length)
-            self.final_series.append(new_series)
-        self.schedule.playoffs(self.final_series, self.series_length)
-        LOGGER.info("")
+        for db_obj in self.distributions.values():
+            db_obj.flush()
 
-    def play_final(self):
+    def close(self):
         """
 
         :return:
         """
-        # self.schedule.playoffs(self.teams, self.series_length)
-        self.schedule.play(0)
-        self.champion = self.final_series[0].winner
-        LOGGER.info(msg="League Winner: {0}\n".format(self.champion.name))
+        for db_obj in self.distributions.values():
+            db_obj.close()
+            if self.open_paths.get(db_obj.db_name) is self:
+                del self.open_paths[db_obj.db_name]
+        self.distributions = {}
 
-    def play(self):
+    def destroy(self):
         """
 
         :return:
         """
-        # Play Regular Season
-        LOGGER.info("Regular Season starts...\n")
-        completed = False
-        while not completed:
-            for conf in self.conferences.values():
-                completed = conf.regular_season() or completed
-        # Display Regular Season Results and Setup Playoffs
-        for distr_name, distr in self.distributions.items():
-            LOGGER.info(msg="Distribution: {0}".format(distr_name))
-            distr.display()
-        if not self.playoffs:
-            LOGGER.info("Season is over")
-            return
-        for conf in self.conferences.values():
-            conf.build_playoffs()
-            conf.build_playouts()
-        # Play Conference Playoffs
-        completed = False
-        LOGGER.info("Playoffs start...\n")
-        while not completed:
-            for conf in self.conferences.values():
-                # conf.setup_playoffs()
-                # conf.setup_playouts()
-                conf.setup_postseason()
-                completed = conf.postseason() or completed
-        # Play Final
-        self.setup_final()
-        self.play_final()
+        for db_obj in self.distributions.values():
+            db_obj.destroy()
+            self._release(db_obj.db_name)
+        self.distributions = {}
 
 
-class Conference(Association):
+def _close_registries():
+    """ At exit, write the pending hits of the leagues neither closed nor destroyed, e.g.
+    with the "exit" flush policy
+
+    :return:
     """
-    Description here
+    for registry in set(DistributionRegistry.open_paths.values()):
+        registry.close()
+
+
+class Events(object):
+    """
+    Simulation events, each one is a list of callbacks called with the arguments of emit.
+    Emitters check the list before building arguments, so an event nobody subscribed to
+    costs a truth test.
     """
 
-    def __init__(self, name):
+    NAMES = ("schedule_created", "match_played", "goal_scored", "day_completed",
+             "series_decided", "season_finished")
+
+    def __init__(self):
         """
 
-        :param name:
         """
-        super().__init__(name)
-        self.divisions = {}
-        self.playoff_teams = []
-        self.playout_teams = []
-        self.playoff_series = []
-        self.playout_series = []
-        self.series_length = 3
+        self.schedule_created = []
+        self.match_played = []
+        self.goal_scored = []
+        self.day_completed = []
+        self.series_decided = []
+        self.season_finished = []
 
-    def add_division(self, name):
+    def __getstate__(self):
+        """ Subscribers are not part of a snapshot, they subscribe again after a resume
+
+        :return:
         """
+        return {name: [] for name in self.NAMES}
 
-        :param name:
+    def subscribe(self, name, callback):
+        """
+
+        :param name: one of NAMES
+        :param callback:
         :return:
         """
-        LOGGER.debug(msg="Adding division {0} ...".format(name))
-        new_div = Division(name)
-        self.divisions[name] = new_div
-        return new_div
+        getattr(self, name).append(callback)
 
-    def display(self):
+    def unsubscribe(self, name, callback):
         """
 
+        :param name: one of NAMES
+        :param callback:
         :return:
         """
-        LOGGER.debug(msg="Conference {0} has {1} "
-                     "divisions".format(self.name,
-                                        len(list(self.divisions.keys()))))
-        for div_name in self.divisions.keys():
-            LOGGER.debug(msg="\t - Division {0}".format(div_name))
-        for div in self.divisions.values():
-            div.display()
+        getattr(self, name).remove(callback)
 
-    def initialize(self):
+    def emit(self, name, *args):
         """
 
+        :param name: one of NAMES
+        :param args: arguments of the callbacks
         :return:
         """
-        for div in self.divisions.values():
-            div.regular_season()
+        for callback in getattr(self, name):
+            callback(*args)
 
-    def regular_season(self):
+
+class EventLogger(object):
+    """
+    Logs matches, goals, days and series as they are played
+    """
+
+    def subscribe(self, events):
         """
 
-        :return: whether schedule is completed
-        :rtype: bool
+        :param events: Events
+        :return:
         """
-        if not self.schedule.completed:
-            play_on = True
-            for div in self.divisions.values():
-                # Regular Season
-                div.play()
-                play_on = play_on and not div.schedule.completed
-            self.schedule.completed = not play_on
-        return self.schedule.completed
+        for name in Events.NAMES:
+            events.subscribe(name, getattr(self, name))
 
-    def build_playoffs(self):
+    @staticmethod
+    def schedule_created(association):
         """
 
+        :param association: Division
         :return:
         """
-        for div in self.divisions.values():
-            self.playoff_teams += div.teams[0:int(len(div.teams)/2)]
-        self.playoff_teams = self._team_sort(self.playoff_teams)
+        association.schedule.display(association.name)
 
-    def build_playouts(self):
+    @staticmethod
+    def match_played(match, minutes):
         """
 
+        :param match: Match
+        :param minutes: 90, 30 for extra time, 0 for penalty kicks
         :return:
         """
-        for div in self.divisions.values():
-            self.playout_teams += div.teams[int(len(div.teams)/2):]
-        self.playout_teams = self._team_sort(self.playout_teams)
+        home_team = match.home_team.name
+        away_team = match.away_team.name
+        if minutes == 0:
+            LOGGER.info("It's again a tie, penalty kicks")
+            LOGGER.info(msg="Penalty kicks {0} {1}: {2} {3}".format(home_team, match.penalties[0],
+                                                                    away_team, match.penalties[1]))
+        elif minutes == 30:
+            LOGGER.info("It's a tie, play extra time")
+        if minutes and match.strengths:
+            strength1, strength2, adjusted1, adjusted2 = match.strengths
+            LOGGER.info(msg="Home Team {0} strength: {1}".format(home_team,
+                                                                 match.home_team.strength))
+            LOGGER.info(msg="Away Team {0} strength: {1}".format(away_team, strength2))
+            if match.home_advantage:
+                LOGGER.info(msg="Home Team {0} strength doubles: {1}".format(home_team,
+                                                                           strength1))
+            LOGGER.info(msg="Home Team {0} adjusted strength: {1}".format(home_team, adjusted1))
+            LOGGER.info(msg="Away Team {0} adjusted strength: {1}".format(away_team, adjusted2))
+            LOGGER.info(msg="Result is {0}".format(match.result))
+        match.score.display(home_team, away_team)
 
-    def setup_postseason(self):
+    @staticmethod
+    def goal_scored(match, minute, team):
         """
 
+        :param match: Match
+        :param minute:
+        :param team: name of the team that scored
         :return:
         """
-        if self.playoff_series or self.playout_series:
-            LOGGER.info("Still playing playoff or playout series")
-            return
-        self.schedule.reset()
-        self.setup_playoffs()
-        self.setup_playouts()
-        self.schedule.playoffs(self.playoff_series + self.playout_series, self.series_length)
-        LOGGER.info("")
+        LOGGER.debug(msg="Minute: {0}, Goal!!! {1} scored".format(minute, team))
 
-    def setup_playoffs(self):
+    @staticmethod
+    def day_completed(association, day):
         """
 
+        :param association: Division, Conference or League
+        :param day: Day
         :return:
         """
-        # if self.playoff_series:
-        #    LOGGER.info("Still playing playoff series")
-        #    return
-        # self.schedule.reset()
-        for team in self.playoff_teams:
-            LOGGER.info(msg="Team {0} in the playoffs".format(team.name))
-        for idx in range(0, int(len(self.playoff_teams) / 2)):
-            team1 = self.playoff_teams[idx]
-            team2 = self.playoff_teams[len(self.teams) - 1 - idx]
-            LOGGER.info("Setting up series, team1={}, team2={}".format(team1.name, team2.name))
-            new_series = Series(team1, team2, self.series_length)
-            self.playoff_series.append(new_series)
-        # self.schedule.playoffs(self.playoff_series, self.series_length)
-        # LOGGER.info("")
+        LOGGER.info(msg="{0} - Day: {1} of {2}\n".format(association.name, day.number,
+                                                        association.schedule.length))
+        if isinstance(association, Division):
+            association.display()
 
-    def setup_playouts(self):
+    @staticmethod
+    def series_decided(series):
         """
 
+        :param series: Series
         :return:
         """
-        # if self.playout_series:
-        #    LOGGER.info("Still playing playout series")
-        #    return
-        # self.schedule.reset()
-        for team in self.playout_teams:
-            LOGGER.info(msg="Team {0} in the playouts".format(team.name))
-        for idx in range(0, int(len(self.playout_teams) / 2)):
-            team1 = self.playout_teams[idx]
-            team2 = self.playout_teams[len(self.teams) - 1 - idx]
-            LOGGER.info("Setting up series, team1={}, team2={}".format(team1.name, team2.name))
-            new_series = Series(team1, team2, self.series_length)
-            self.playout_series.append(new_series)
-        # self.schedule.playoffs(self.playout_series, self.series_length)
-        # LOGGER.info("")
+        LOGGER.debug(msg="Series is over, Winner: {0}, "
+                     "Loser: {1}".format(series.winner.name, series.loser.name))
 
-    def postseason(self):
+    @staticmethod
+    def season_finished(league):
         """
 
-        :return: whether schedule is completed
-        :rtype: bool
+        :param league: League
+        :return:
         """
-        # self.schedule.playoffs(self.teams, self.series_length)
-        self.schedule.play(0)
-        if self.schedule.completed:
-            # Playoffs
-            if len(self.playoff_series) > 1:
-                LOGGER.info("More playoffs, series={}".format(len(self.playoff_series)))
-                self.playoff_teams = []
-                for series in self.playoff_series:
-                    self.playoff_teams.append(series.winner)
-                self.playoff_series = []
-                self.schedule.completed = False
-            else:
-                self.champion = self.playoff_teams[0]
-                LOGGER.info(msg="Conference {0} - Playoffs are over".format(self.name))
-                LOGGER.info(msg="Winner: {0}\n".format(self.champion.name))
-            # Playouts
-            if len(self.playout_series) > 2:
-                LOGGER.info("More playouts, series={}".format(len(self.playout_series)))
-                self.playout_teams = []
-                for series in self.playout_series:
-                    self.playout_teams.append(series.loser)
-                self.playout_series = []
-                self.schedule.completed = False
-            else:
-                # Teams to be relegated
-                for team in self.playout_teams:
-                    LOGGER.info("Team {0} to be relegated: {0}".format(team.name))
-        return self.schedule.completed
+        LOGGER.info(msg="League {0} - Season is over".format(league.name))
 
 
-class Division(Association):
+class MatchWriter(object):
+    """
+    Writes the matches of a league as JSON Lines or CSV while it plays, through a large
+    write buffer, so that nothing is kept in memory
+    """
+
+    def __init__(self, path, fmt="jsonl", append=False, buffer_size=1 << 20):
+        """
+
+        :param path: output file
+        :param fmt: one of MATCH_FORMATS
+        :param append: add to the file instead of replacing it
+        :param buffer_size: bytes buffered before a write
+        """
+        if fmt not in MATCH_FORMATS:
+            raise RuntimeError("Error: unknown match format {0}".format(fmt))
+        self.fmt = fmt
+        self.league = None
+        header = not (append and os.path.exists(path) and os.path.getsize(path))
+        self.stream = open(path, "a" if append else "w", newline="", buffering=buffer_size)
+        self.writer = None
+        if fmt == "csv":
+            import csv
+            self.writer = csv.writer(self.stream)
+            if header:
+                self.writer.writerow(MatchRecord._fields)
+
+    def subscribe(self, league):
+        """ Write the matches of each day the league plays
+
+        :param league: League
+        :return:
+        """
+        self.league = league
+        league.events.subscribe("day_completed", self.day_completed)
+
+    def day_completed(self, association, day):
+        """
+
+        :param association: Division, Conference or League
+        :param day: Day
+        :return:
+        """
+        for record in self.league.records(association, day):
+            self.write(record)
+
+    def write(self, record):
+        """
+
+        :param record: MatchRecord
+        :return:
+        """
+        if self.writer is not None:
+            self.writer.writerow(record)
+        else:
+            import json
+            self.stream.write(json.dumps(record._asdict()) + "\n")
+
+    def close(self):
+        """
+
+        :return:
+        """
+        self.stream.close()
+
+
+class Association:
     """
     Description here
     """
@@ -569,543 +994,3110 @@ class Division(Association):
 
         :param name:
         """
+        self.name = name
+        self.teams = []
+        self.champion = None
+        self.schedule = Schedule()
+        self.events = self.schedule.events
+
+    def destroy(self):
+        """
+
+        :return:
+        """
+        LOGGER.info("stub for destroy")
+
+    def reset(self):
+        """ Clear season results, teams and structure are kept
+
+        :return:
+        """
+        self.champion = None
+        self.schedule.reset()
+
+
+class League(Association):
+    """
+    Description here
+    """
+
+    def __init__(self, name, db_dir=None):
+        """
+
+        :param name:
+        :param db_dir: directory for the database files, current directory if None
+        """
         super().__init__(name)
+        # all teams of the league
+        self.store = TeamStore()
+        # DB files are named after the league, leagues do not share them
+        prefix = re.sub(r'\W+', '_', name.lower()).strip('_') + "_"
+        self.distributions = DistributionRegistry(db_dir, prefix)
+        self.conferences = {}
+        self.playoffs = False
+        self.final_series = []
+        self.series_length = 1
+        self.flush_on = "season"
+        self.engine = None
+        # random number generator used by all matches, see seed()
+        self.rng = random
+        self.seed_value = None
+        # luck draws of Match.play have their own stream, see seed()
+        self.luck = random
+        self.luck_seed = None
+        self.antithetic = False
+        # goal minutes, drawn only when asked for, see Match.timeline
+        self.timeline_rng = random
+        # yaml file the league was loaded from, workers load their own copy
+        self.league_file = None
+        # number of processes playing the conferences, see play()
+        self.workers = 1
+        # "regular_season", "postseason", "playoffs" or "final", see play()
+        self.phase = "regular_season"
+        # season number of the match records, set by MonteCarlo
+        self.season = 0
+        # draw results with a single uniform from the exact probabilities, see Match.play
+        self.fast_outcomes = False
+        self.outcomes = None
+        # Checkpoint written at the end of each day, if any
+        self.checkpoint = None
+
+    def __getstate__(self):
+        """ Snapshot of the league, see Checkpoint
 
-    def add_team(self, name):
+        :return:
+        """
+        state = dict(self.__dict__)
+        state["checkpoint"] = None
+        # rebuilt from the strengths by __setstate__
+        state["outcomes"] = None
+        for name in ("rng", "luck", "timeline_rng"):
+            if state[name] is random:
+                state[name] = None
+        return state
+
+    def __setstate__(self, state):
+        """
+
+        :param state: see __getstate__
+        :return:
+        """
+        self.__dict__.update(state)
+        if self.rng is None:
+            self.rng = random
+        if self.luck is None:
+            self.luck = random
+        if self.timeline_rng is None:
+            self.timeline_rng = random
+        if self.fast_outcomes:
+            outcomes = self.outcome_matrix()
+            for assoc in self.associations():
+                assoc.schedule.set_outcomes(outcomes)
+
+    def add_conference(self, name):
         """
 
         :param name:
         :return:
         """
-        LOGGER.debug(msg="Adding team {0} ...".format(name))
-        new_team = Team(name)
-        self.teams.append(new_team)
-        return new_team
+        LOGGER.debug(msg="Adding conference {0} ...".format(name))
+        new_conf = Conference(name, self.store)
+        self.conferences[name] = new_conf
+        return new_conf
+
+    def create_distribution_db(self, name, probabilities=None):
+        """
+
+        :param name:
+        :param probabilities: {score: probability} to bulk load, empty table to add scores to if None
+        :return:
+        """
+        new_db = self.distributions.create(name)
+        try:
+            if probabilities is None:
+                new_db.create_table()
+            else:
+                new_db.bulk_load(probabilities)
+        except BaseException:
+            self.distributions.release(name)
+            raise
+        return new_db
+
+    def destroy(self, discard=False):
+        """ Drop the distribution DBs, pending hits are written first whatever the flush
+        policy
+
+        :param discard: drop pending hits without writing them, for DBs thrown away
+        :return:
+        """
+        if not discard:
+            self.flush()
+        self.distributions.destroy()
+
+    def close(self):
+        """ Like destroy, but keeps the distribution DBs for the next run
+
+        :return:
+        """
+        self.distributions.close()
+
+    def reset(self):
+        """ Clear season results in the league, its conferences and divisions
+
+        :return:
+        """
+        for assoc in self.associations():
+            if assoc is not self:
+                assoc.reset()
+        super().reset()
+        self.store.reset()
+        self.teams = []
+        self.final_series = []
+        self.phase = "regular_season"
+
+    def flush(self, boundary=None):
+        """ Write pending hit counts to the distribution DBs
+
+        :param boundary: one of FLUSH_BOUNDARIES, flush only if the policy (flush_on) asks
+                         for it at this boundary, flush unconditionally if None
+        :return:
+        """
+        # boundaries finer than the policy are skipped, e.g. days when flushing by season
+        if boundary is not None and \
+                FLUSH_BOUNDARIES.index(boundary) < FLUSH_BOUNDARIES.index(self.flush_on):
+            return
+        self.distributions.flush()
 
     def display(self):
         """
 
         :return:
         """
-        LOGGER.info(msg="Division {0} Table\n".format(self.name))
-        LOGGER.info(msg="--- {:15s} ---".format(self.name))
+        LOGGER.debug("\n")
+        LOGGER.debug(msg="League {0} has {1} "
+                     "conferences:".format(self.name,
+                                           len(list(self.conferences.keys()))))
+        for conf_name, conf in self.conferences.items():
+            LOGGER.debug(msg="\t - Conference {0}".format(conf_name))
+        for conf in self.conferences.values():
+            conf.display()
+
+    def associations(self):
+        """ League, conferences and divisions
+
+        :return: generator
+        """
+        yield self
+        for conf in self.conferences.values():
+            yield conf
+            for div in conf.divisions.values():
+                yield div
+
+    def initialize(self):
+        """
+
+        :return:
+        """
+        outcomes = self.outcome_matrix() if self.fast_outcomes else None
+        for assoc in self.associations():
+            assoc.schedule.engine = self.engine
+            assoc.schedule.rng = self.rng
+            assoc.schedule.luck = self.luck
+            assoc.schedule.timeline_rng = self.timeline_rng
+            assoc.schedule.distributions = self.distributions
+            assoc.schedule.outcomes = outcomes
+            assoc.events = assoc.schedule.events = self.events
+        if self.seed_value is not None:
+            # each conference has its own streams, whether it is played here or in a worker
+            for conf in self.conferences.values():
+                conf_seed = self.conference_seed(self.seed_value, conf.name)
+                luck_seed = self.conference_seed(self.luck_seed, conf.name)
+                rng = random.Random(conf_seed)
+                luck = self._luck_generator(luck_seed)
+                engine = BatchEngine(conf_seed, luck_seed, self.antithetic) \
+                    if self.engine else None
+                for assoc in [conf] + list(conf.divisions.values()):
+                    assoc.schedule.rng = rng
+                    assoc.schedule.luck = luck
+                    assoc.schedule.engine = engine
+        for conf in self.conferences.values():
+            conf.initialize()
+
+    def outcome_matrix(self):
+        """ Built once, and again only if strengths change
+
+        :return: OutcomeMatrix of the teams of the league
+        """
+        if self.outcomes is None or not self.outcomes.is_current(self.store):
+            self.outcomes = OutcomeMatrix(self.store)
+        return self.outcomes
+
+    def expected_standings(self):
+        """ Expected regular season points from the exact match probabilities, without
+        playing: each team of a division meets the others at home and away
+
+        :return: {division name: [(team name, expected points)] by expected points}
+        """
+        outcomes = self.outcome_matrix()
+        standings = {}
+        for conf in self.conferences.values():
+            for div_name, div in conf.divisions.items():
+                points = dict.fromkeys(div.roster, 0.0)
+                for home_team in div.roster:
+                    for away_team in div.roster:
+                        if home_team is away_team:
+                            continue
+                        home_points, away_points = outcomes.expected_points(home_team,
+                                                                            away_team)
+                        points[home_team] += home_points
+                        points[away_team] += away_points
+                table = sorted(div.roster, key=lambda team: -points[team])
+                standings[div_name] = [(team.name, points[team]) for team in table]
+        return standings
+
+    def display_expected_standings(self):
+        """
+
+        :return:
+        """
+        for div_name, table in self.expected_standings().items():
+            LOGGER.info(msg="--- {:15s} ---".format(div_name))
+            for team, points in table:
+                LOGGER.info(msg="{:20s} {:6.2f}".format(team, points))
+            LOGGER.info("")
+
+    def seed(self, seed, luck_seed=None, antithetic=False):
+        """ Give the league its own random number generators. Leagues with the same
+        teams and the same luck seed play under the same luck draws (common random
+        numbers), whatever their strengths.
+
+        :param seed: integer seed
+        :param luck_seed: seed of the luck draws, derived from seed if None
+        :param antithetic: use 1 - u for every luck uniform u, see AntitheticRandom
+        :return:
+        """
+        if luck_seed is None:
+            luck_seed = self.conference_seed(seed, "luck")
+        self.rng = random.Random(seed)
+        self.seed_value = seed
+        self.luck_seed = luck_seed
+        self.antithetic = antithetic
+        self.luck = self._luck_generator(luck_seed)
+        self.timeline_rng = random.Random(self.conference_seed(seed, "timeline"))
+        if self.engine:
+            self.engine.seed(seed, luck_seed, antithetic)
+
+    def _luck_generator(self, seed):
+        """
+
+        :param seed: integer seed
+        :return: random.Random, or AntitheticRandom if the league is antithetic
+        """
+        if self.antithetic:
+            return AntitheticRandom(seed)
+        return random.Random(seed)
+
+    @staticmethod
+    def conference_seed(seed, name):
+        """ Seed of a conference, it only depends on the league seed and the conference name
+
+        :param seed: league seed
+        :param name: conference name
+        :return: integer seed
+        """
+        return random.Random("{0}-{1}".format(seed, name)).getrandbits(64)
+
+    def setup_final(self):
+        """
+
+        :return:
+        """
+        self.schedule.reset()
+        for conf in self.conferences.values():
+            self.teams.append(conf.champion)
+        self.teams = Standings.rank(self.teams)
         for team in self.teams:
-            LOGGER.info(msg="{:20s} {:2d}".format(team.name, team.points))
+            LOGGER.info(msg="Team {0} made the final".format(team.name))
+        for idx in range(0, int(len(self.teams)/2)):
+            team1 = self.teams[idx]
+            team2 = self.teams[len(self.teams) - 1 - idx]
+            new_series = Series(team1, team2, self.series_length)
+            self.final_series.append(new_series)
+        self.schedule.playoffs(self.final_series, self.series_length)
         LOGGER.info("")
 
-    def regular_season(self):
+    def play_final(self):
         """
 
         :return:
         """
-        self.schedule.round_robin(self.teams)
-        self.schedule.display(self.name)
+        # self.schedule.playoffs(self.teams, self.series_length)
+        if not self.final_series:
+            # single conference league
+            self.champion = self.teams[0]
+            LOGGER.info(msg="League Winner: {0}\n".format(self.champion.name))
+            return
+        day = self.schedule.current_day
+        self.schedule.play(0)
+        if self.events.day_completed:
+            self.events.emit("day_completed", self, day)
+        self.flush("day")
+        self.champion = self.final_series[0].winner
+        LOGGER.info(msg="League Winner: {0}\n".format(self.champion.name))
 
     def play(self):
-        """
+        """ Play the season, or what is left of it for a league restored from a snapshot
 
         :return:
         """
-        self.schedule.play(90)
-        self.teams = self._team_sort(self.teams)
-        self.display()
-
+        for _ in self.days():
+            pass
 
-class Team(object):
-    """
-    Description here
-    """
+    def days(self):
+        """ Play the season a day at a time, see play()
 
-    def __init__(self, name):
+        :return: generator, it yields when a day is over
+        """
+        if self.phase == "regular_season":
+            if self.workers > 1 and len(self.conferences) > 1:
+                # Regular Season and Conference Playoffs in workers
+                self.play_conferences()
+            else:
+                yield from self._regular_season_days()
+            # Display Regular Season Results and Setup Playoffs
+            for distr_name, distr in self.distributions.items():
+                LOGGER.info(msg="Distribution: {0}".format(distr_name))
+                distr.display()
+        if not self.playoffs:
+            self.flush("season")
+            LOGGER.info("Season is over")
+            if self.events.season_finished:
+                self.events.emit("season_finished", self)
+            return
+        if self.phase != "final":
+            yield from self._postseason_days()
+        # Play Final
+        self.setup_final()
+        self.play_final()
+        yield
+        self.flush("season")
+        if self.events.season_finished:
+            self.events.emit("season_finished", self)
+
+    def matches(self):
+        """ Play the season, or what is left of it, a day at a time
+
+        :return: generator of MatchRecord, matches of a day come when the day is over
+        """
+        if self.workers > 1 and len(self.conferences) > 1:
+            raise RuntimeError("Error: matches played in workers are not available")
+        played = []
+
+        def day_completed(association, day):
+            played.extend(self.records(association, day))
+        self.events.subscribe("day_completed", day_completed)
+        try:
+            for _ in self.days():
+                records = list(played)
+                del played[:]
+                yield from records
+        finally:
+            self.events.unsubscribe("day_completed", day_completed)
+
+    def records(self, association, day):
+        """
+
+        :param association: Division, Conference or League that played the day
+        :param day: Day
+        :return: MatchRecord of each match played that day
+        """
+        records = []
+        for match in day.matches:
+            if not match.played:
+                # series already over
+                continue
+            if association is self:
+                phase = "final"
+            elif match.series is None:
+                phase = "regular_season"
+            elif match.series in association.playoff_series:
+                phase = "playoffs"
+            else:
+                phase = "playouts"
+            penalties = match.penalties or (None, None)
+            records.append(MatchRecord(self.season, phase, day.number, match.home_team.name,
+                                       match.away_team.name, match.score.home,
+                                       match.score.away, match.extra_time, *penalties))
+        return records
+
+    def play_regular_season(self):
+        """ Play all conferences a day at a time until every division is done
+
+        :return:
+        """
+        for _ in self._regular_season_days():
+            pass
+
+    def _regular_season_days(self):
+        """
+
+        :return: generator, it yields when a day is over
+        """
+        LOGGER.info("Regular Season starts...\n")
+        completed = False
+        while not completed:
+            completed = True
+            for conf in self.conferences.values():
+                completed = conf.regular_season() and completed
+            self.flush("day")
+            self.save_checkpoint()
+            yield
+        self.phase = "postseason"
+
+    def play_postseason(self):
+        """ Play playoffs and playouts of all conferences
+
+        :return:
+        """
+        for _ in self._postseason_days():
+            pass
+
+    def _postseason_days(self):
+        """
+
+        :return: generator, it yields when a day is over
+        """
+        if self.phase == "postseason":
+            for conf in self.conferences.values():
+                conf.build_playoffs()
+                conf.build_playouts()
+            self.phase = "playoffs"
+        completed = False
+        LOGGER.info("Playoffs start...\n")
+        while not completed:
+            completed = True
+            for conf in self.conferences.values():
+                # conf.setup_playoffs()
+                # conf.setup_playouts()
+                conf.setup_postseason()
+                completed = conf.postseason() and completed
+            self.flush("day")
+            self.save_checkpoint()
+            yield
+        self.phase = "final"
+
+    def save_checkpoint(self):
+        """ Write a snapshot of the league if the checkpoint is due, at the end of a day
+
+        :return:
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.update("league", lambda: self)
+
+    def play_conferences(self):
+        """ Play the regular season and the playoffs of each conference in a pool of
+        processes, each loading its own copy of the league with the seeds and the
+        strengths of this one. Only tables, champions, relegated teams and hit counts
+        come back, events of the conferences are not emitted.
+        With a seed, results are the same as playing them here.
+
+        :return:
+        """
+        if self.league_file is None:
+            raise RuntimeError("Error: league {0} was not loaded from a file".format(self.name))
+        engine = "batch" if self.engine else "match"
+        import concurrent.futures
+        LOGGER.info(msg="Playing {0} conferences in {1} "
+                    "workers...\n".format(len(self.conferences), self.workers))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {conf_name: executor.submit(_conference_worker, self.league_file,
+                                                  conf_name, engine, self.playoffs,
+                                                  self.seed_value, self.fast_outcomes,
+                                                  self.luck_seed, self.antithetic,
+                                                  self.store.strength)
+                       for conf_name in self.conferences}
+            for conf_name, future in futures.items():
+                results, hits = future.result()
+                self.conferences[conf_name].apply(results)
+                for distr_name, (samples, scores) in hits.items():
+                    distr = self.distributions[distr_name]
+                    distr.samples += samples
+                    for score, hit in scores.items():
+                        distr.record(score, hit)
+        for conf in self.conferences.values():
+            for div in conf.divisions.values():
+                div.display()
+        self.phase = "final"
+
+
+class Conference(Association):
+    """
+    Description here
+    """
+
+    def __init__(self, name, store=None):
+        """
+
+        :param name:
+        :param store: TeamStore of the league
+        """
+        super().__init__(name)
+        self.store = store if store is not None else TeamStore()
+        self.divisions = {}
+        self.playoff_teams = []
+        self.playout_teams = []
+        self.playoff_series = []
+        self.playout_series = []
+        self.relegated = None
+        self.series_length = 3
+
+    def add_division(self, name):
+        """
+
+        :param name:
+        :return:
+        """
+        LOGGER.debug(msg="Adding division {0} ...".format(name))
+        new_div = Division(name, self.store)
+        self.divisions[name] = new_div
+        return new_div
+
+    def display(self):
+        """
+
+        :return:
+        """
+        LOGGER.debug(msg="Conference {0} has {1} "
+                     "divisions".format(self.name,
+                                        len(list(self.divisions.keys()))))
+        for div_name in self.divisions.keys():
+            LOGGER.debug(msg="\t - Division {0}".format(div_name))
+        for div in self.divisions.values():
+            div.display()
+
+    def initialize(self):
+        """
+
+        :return:
+        """
+        for div in self.divisions.values():
+            div.regular_season()
+
+    def reset(self):
+        """
+
+        :return:
+        """
+        super().reset()
+        self.playoff_teams = []
+        self.playout_teams = []
+        self.playoff_series = []
+        self.playout_series = []
+        self.relegated = None
+
+    def results(self):
+        """ Outcome of the season of the conference, by team name
+
+        :return: {"divisions": {division name: [(team, points, goals for, goals against)]},
+                  "champion": team or None, "relegated": [team] or None}
+        """
+        divisions = {}
+        for div_name, div in self.divisions.items():
+            divisions[div_name] = [(team.name, team.points, team.goals_for, team.goals_against)
+                                   for team in div.teams]
+        return {
+            "divisions": divisions,
+            "champion": self.champion.name if self.champion is not None else None,
+            "relegated": [team.name for team in self.relegated]
+                         if self.relegated is not None else None,
+        }
+
+    def apply(self, results):
+        """ Take the outcome of a season played elsewhere, see results()
+
+        :param results: results() of the same conference
+        :return:
+        """
+        teams = {}
+        for div in self.divisions.values():
+            for team in div.roster:
+                teams[team.name] = team
+        for div_name, table in results["divisions"].items():
+            div = self.divisions[div_name]
+            div.teams = []
+            for name, points, goals_for, goals_against in table:
+                team = teams[name]
+                team.points = points
+                self.store.goals_for[team.id] = goals_for
+                self.store.goals_against[team.id] = goals_against
+                div.teams.append(team)
+            div.schedule.completed = True
+        self.schedule.completed = True
+        if results["champion"] is not None:
+            self.champion = teams[results["champion"]]
+        if results["relegated"] is not None:
+            self.relegated = [teams[name] for name in results["relegated"]]
+
+    def regular_season(self):
+        """
+
+        :return: whether schedule is completed
+        :rtype: bool
+        """
+        if not self.schedule.completed:
+            completed = True
+            for div in self.divisions.values():
+                # Regular Season
+                if not div.schedule.completed:
+                    div.play()
+                completed = completed and div.schedule.completed
+            self.schedule.completed = completed
+        return self.schedule.completed
+
+    def build_playoffs(self):
+        """
+
+        :return:
+        """
+        for div in self.divisions.values():
+            self.playoff_teams += div.teams[0:int(len(div.teams)/2)]
+        self.playoff_teams = Standings.rank(self.playoff_teams)
+
+    def build_playouts(self):
+        """
+
+        :return:
+        """
+        for div in self.divisions.values():
+            self.playout_teams += div.teams[int(len(div.teams)/2):]
+        self.playout_teams = Standings.rank(self.playout_teams)
+
+    def setup_postseason(self):
+        """
+
+        :return:
+        """
+        if self.playoff_series or self.playout_series:
+            LOGGER.info("Still playing playoff or playout series")
+            return
+        if self.champion is not None and self.relegated is not None:
+            return
+        self.schedule.reset()
+        self.setup_playoffs()
+        self.setup_playouts()
+        if not (self.playoff_series or self.playout_series):
+            return
+        self.schedule.playoffs(self.playoff_series + self.playout_series, self.series_length)
+        LOGGER.info("")
+
+    def setup_playoffs(self):
+        """
+
+        :return:
+        """
+        # if self.playoff_series:
+        #    LOGGER.info("Still playing playoff series")
+        #    return
+        # self.schedule.reset()
+        if self.champion is not None:
+            return
+        if len(self.playoff_teams) == 1:
+            self.champion = self.playoff_teams[0]
+            return
+        for team in self.playoff_teams:
+            LOGGER.info(msg="Team {0} in the playoffs".format(team.name))
+        for idx in range(0, int(len(self.playoff_teams) / 2)):
+            team1 = self.playoff_teams[idx]
+            team2 = self.playoff_teams[len(self.teams) - 1 - idx]
+            LOGGER.info("Setting up series, team1={}, team2={}".format(team1.name, team2.name))
+            new_series = Series(team1, team2, self.series_length)
+            self.playoff_series.append(new_series)
+        # self.schedule.playoffs(self.playoff_series, self.series_length)
+        # LOGGER.info("")
+
+    def setup_playouts(self):
+        """
+
+        :return:
+        """
+        # if self.playout_series:
+        #    LOGGER.info("Still playing playout series")
+        #    return
+        # self.schedule.reset()
+        if self.relegated is not None:
+            return
+        if len(self.playout_teams) < 2:
+            self.relegated = list(self.playout_teams)
+            return
+        for team in self.playout_teams:
+            LOGGER.info(msg="Team {0} in the playouts".format(team.name))
+        for idx in range(0, int(len(self.playout_teams) / 2)):
+            team1 = self.playout_teams[idx]
+            team2 = self.playout_teams[len(self.teams) - 1 - idx]
+            LOGGER.info("Setting up series, team1={}, team2={}".format(team1.name, team2.name))
+            new_series = Series(team1, team2, self.series_length)
+            self.playout_series.append(new_series)
+        # self.schedule.playoffs(self.playout_series, self.series_length)
+        # LOGGER.info("")
+
+    def postseason(self):
+        """
+
+        :return: whether schedule is completed
+        :rtype: bool
+        """
+        # self.schedule.playoffs(self.teams, self.series_length)
+        if not (self.playoff_series or self.playout_series):
+            return True
+        day = self.schedule.current_day
+        self.schedule.play(0)
+        if self.events.day_completed:
+            self.events.emit("day_completed", self, day)
+        if self.schedule.completed:
+            # Playoffs
+            if len(self.playoff_series) > 1:
+                LOGGER.info("More playoffs, series={}".format(len(self.playoff_series)))
+                self.playoff_teams = []
+                for series in self.playoff_series:
+                    self.playoff_teams.append(series.winner)
+                self.schedule.completed = False
+            elif self.playoff_series:
+                self.champion = self.playoff_series[0].winner
+                LOGGER.info(msg="Conference {0} - Playoffs are over".format(self.name))
+                LOGGER.info(msg="Winner: {0}\n".format(self.champion.name))
+            self.playoff_series = []
+            # Playouts
+            if len(self.playout_series) > 2:
+                LOGGER.info("More playouts, series={}".format(len(self.playout_series)))
+                self.playout_teams = []
+                for series in self.playout_series:
+                    self.playout_teams.append(series.loser)
+                self.schedule.completed = False
+            elif self.playout_series:
+                # Teams to be relegated
+                self.relegated = [series.loser for series in self.playout_series]
+                for team in self.relegated:
+                    LOGGER.info("Team {0} to be relegated".format(team.name))
+            self.playout_series = []
+        return self.schedule.completed
+
+
+class Division(Association):
+    """
+    Description here
+    """
+
+    def __init__(self, name, store=None):
+        """
+
+        :param name:
+        :param store: TeamStore of the league
+        """
+        super().__init__(name)
+        self.store = store if store is not None else TeamStore()
+        # teams in their original order, self.teams is sorted by standings
+        self.roster = []
+        self.standings = None
+
+    def add_team(self, name):
+        """
+
+        :param name:
+        :return:
+        """
+        LOGGER.debug(msg="Adding team {0} ...".format(name))
+        new_team = Team(name, self.store)
+        self.teams.append(new_team)
+        self.roster.append(new_team)
+        return new_team
+
+    def display(self):
+        """
+
+        :return:
+        """
+        LOGGER.info(msg="Division {0} Table\n".format(self.name))
+        LOGGER.info(msg="--- {:15s} ---".format(self.name))
+        for team in self.teams:
+            LOGGER.info(msg="{:20s} {:2d}".format(team.name, team.points))
+        LOGGER.info("")
+
+    def reset(self):
+        """ Restore the original order of the teams, their points are cleared by
+        League.reset in the TeamStore
+
+        :return:
+        """
+        super().reset()
+        self.teams = list(self.roster)
+
+    def regular_season(self):
+        """
+
+        :return:
+        """
+        self.standings = Standings(self.roster)
+        self.schedule.standings = self.standings
+        self.schedule.round_robin(self.teams)
+        if self.events.schedule_created:
+            self.events.emit("schedule_created", self)
+
+    def play(self):
+        """
+
+        :return:
+        """
+        day = self.schedule.current_day
+        self.schedule.play(90)
+        self.teams = self.standings.table()
+        if self.events.day_completed:
+            self.events.emit("day_completed", self, day)
+
+
+class TeamStore(object):
+    """
+    Attributes of all teams of a league in parallel typed arrays, indexed by team id
+    """
+
+    def __init__(self):
+        """
+
+        """
+        self.names = []
+        self.strength = array.array('d')
+        self.points = array.array('l')
+        self.series_wins = array.array('l')
+        self.goals_for = array.array('l')
+        self.goals_against = array.array('l')
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name):
+        """
+
+        :param name:
+        :return: team id
+        """
+        self.names.append(name)
+        self.strength.append(0)
+        self.points.append(0)
+        self.series_wins.append(0)
+        self.goals_for.append(0)
+        self.goals_against.append(0)
+        return len(self.names) - 1
+
+    def reset(self):
+        """ Clear points, series wins and goals of all teams
+
+        :return:
+        """
+        zeros = array.array('l', bytes(self.points.itemsize * len(self.names)))
+        self.points[:] = zeros
+        self.series_wins[:] = zeros
+        self.goals_for[:] = zeros
+        self.goals_against[:] = zeros
+
+
+class Team(object):
+    """
+    View of a team in a TeamStore
+    """
+
+    __slots__ = ("store", "id")
+
+    def __init__(self, name, store=None):
+        """
+
+        :param name:
+        :param store: TeamStore of the league, the team gets its own if None
+        """
+        self.store = store if store is not None else TeamStore()
+        self.id = self.store.add(name)
+
+    @property
+    def name(self):
+        return self.store.names[self.id]
+
+    @property
+    def strength(self):
+        return self.store.strength[self.id]
+
+    @strength.setter
+    def strength(self, value):
+        self.store.strength[self.id] = value
+
+    @property
+    def points(self):
+        return self.store.points[self.id]
+
+    @points.setter
+    def points(self, value):
+        self.store.points[self.id] = value
+
+    @property
+    def series_wins(self):
+        return self.store.series_wins[self.id]
+
+    @series_wins.setter
+    def series_wins(self, value):
+        self.store.series_wins[self.id] = value
+
+    @property
+    def goals_for(self):
+        return self.store.goals_for[self.id]
+
+    @property
+    def goals_against(self):
+        return self.store.goals_against[self.id]
+
+
+class OutcomeMatrix(object):
+    """
+    Exact home win and away win probabilities of pairs of teams of a TeamStore, home team
+    with home advantage. A pair is computed the first time it is asked for and cached, a
+    season only meets the pairs of its schedule.
+    """
+
+    def __init__(self, store):
+        """
+
+        :param store: TeamStore
+        """
+        self.size = len(store)
+        # strengths the probabilities are computed with
+        self.strength = array.array('d', store.strength)
+        # {home id * size + away id: (home, away)}
+        self.pairs = {}
+
+    def is_current(self, store):
+        """
+
+        :param store: TeamStore
+        :return: whether the matrix is up to date with the teams and strengths of store
+        """
+        return self.strength == store.strength
+
+    def pair(self, home_id, away_id):
+        """
+
+        :param home_id: id of the home team
+        :param away_id: id of the away team
+        :return: (home, away) probabilities, home team with home advantage
+        """
+        key = home_id * self.size + away_id
+        probabilities = self.pairs.get(key)
+        if probabilities is None:
+            home, _, away = outcome_probabilities(self.strength[home_id],
+                                                  self.strength[away_id])
+            probabilities = self.pairs[key] = (home, away)
+        return probabilities
+
+    def probabilities(self, home_team, away_team, home_advantage=True):
+        """
+
+        :param home_team: Team
+        :param away_team: Team
+        :param home_advantage: whether home team strength doubles
+        :return: (home, draw, away) probabilities
+        """
+        if not home_advantage:
+            return outcome_probabilities(home_team.strength, away_team.strength, False)
+        home, away = self.pair(home_team.id, away_team.id)
+        return home, 1 - home - away, away
+
+    def expected_points(self, home_team, away_team):
+        """
+
+        :param home_team: Team
+        :param away_team: Team
+        :return: expected points of the home team and of the away team
+        """
+        home, draw, away = self.probabilities(home_team, away_team)
+        return 3 * home + draw, 3 * away + draw
+
+
+class Standings(object):
+    """
+    Teams of a division ordered by points, goal difference, goals scored, head-to-head
+    points and finally their original order. Sort keys are kept in a sorted list and
+    moved with a binary search when a match is recorded.
+    """
+
+    def __init__(self, teams):
+        """
+
+        :param teams: teams in their original order
+        """
+        self.teams = list(teams)
+        self.position = {team.id: idx for idx, team in enumerate(self.teams)}
+        # points earned by a team against another one: {(team id, opponent id): points}
+        self.head_to_head = {}
+        self.key_of = {team.id: self._key(team) for team in self.teams}
+        self.keys = sorted(self.key_of.values())
+
+    def _key(self, team):
+        """
+
+        :param team:
+        :return: sort key
+        """
+        goals_for = team.goals_for
+        return (-team.points, team.goals_against - goals_for, -goals_for,
+                self.position[team.id])
+
+    def _move(self, team):
+        """ Replace the sort key of team after its points or goals changed
+
+        :param team:
+        :return:
+        """
+        old_key = self.key_of[team.id]
+        del self.keys[bisect.bisect_left(self.keys, old_key)]
+        new_key = self._key(team)
+        bisect.insort(self.keys, new_key)
+        self.key_of[team.id] = new_key
+
+    def record(self, match, home_points, away_points):
+        """ Add the result of a match, points are already added to the teams
+
+        :param match: Match
+        :param home_points:
+        :param away_points:
+        :return:
+        """
+        home = match.home_team
+        away = match.away_team
+        store = home.store
+        store.goals_for[home.id] += match.score.home
+        store.goals_against[home.id] += match.score.away
+        store.goals_for[away.id] += match.score.away
+        store.goals_against[away.id] += match.score.home
+        pair = (home.id, away.id)
+        self.head_to_head[pair] = self.head_to_head.get(pair, 0) + home_points
+        pair = (away.id, home.id)
+        self.head_to_head[pair] = self.head_to_head.get(pair, 0) + away_points
+        self._move(home)
+        self._move(away)
+
+    def table(self):
+        """
+
+        :return: teams in standings order
+        """
+        teams = [self.teams[key[3]] for key in self.keys]
+        # teams level on points, goal difference and goals scored
+        start = 0
+        for idx in range(1, len(self.keys) + 1):
+            if idx < len(self.keys) and self.keys[idx][:3] == self.keys[start][:3]:
+                continue
+            if idx - start > 1:
+                teams[start:idx] = self._head_to_head(teams[start:idx])
+            start = idx
+        return teams
+
+    def _head_to_head(self, teams):
+        """
+
+        :param teams: teams level on points, in their original order
+        :return: teams ordered by points earned against each other
+        """
+        ids = [team.id for team in teams]
+        return sorted(teams, key=lambda team: -sum(self.head_to_head.get((team.id, other), 0)
+                                                  for other in ids))
+
+    @staticmethod
+    def rank(teams):
+        """ Order teams that may not have played each other, e.g. from different divisions
+
+        :param teams:
+        :return: teams by points, goal difference and goals scored, then in the given order
+        """
+        return sorted(teams, key=lambda team: (-team.points,
+                                               team.goals_against - team.goals_for,
+                                               -team.goals_for))
+
+
+class Schedule(object):
+    """
+    Description here
+    """
+
+    def __init__(self):
+        """
+        Description here
+        """
+        # days are generated one at a time, see _start()
+        self.current_day = None
+        self.length = 0
+        self._days = iter(())
+        self._source = None
+        # method and arguments that started the schedule, see __getstate__
+        self._plan = None
+        self.completed = False
+        self.series_list = []
+        # BatchEngine playing a whole day at once, matches are played one by one if None
+        self.engine = None
+        self.rng = random
+        # luck draws and goal minutes of the matches, see Match
+        self.luck = random
+        self.timeline_rng = random
+        self.events = Events()
+        # DistributionRegistry of the league
+        self.distributions = None
+        # OutcomeMatrix of the league for single draw results, if any
+        self.outcomes = None
+        # Standings updated by regular season matches
+        self.standings = None
+
+    def __getstate__(self):
+        """ Snapshot at the end of a day: the day generator is replaced by the number
+        of the current day, see __setstate__
+
+        :return:
+        """
+        state = dict(self.__dict__)
+        state["current_day"] = self.current_day.number if self.current_day else None
+        del state["_days"]
+        del state["_source"]
+        # OutcomeMatrix of the league, see League.__setstate__
+        state["outcomes"] = None
+        for name in ("rng", "luck", "timeline_rng"):
+            if state[name] is random:
+                state[name] = None
+        return state
+
+    def __setstate__(self, state):
+        """ Start the schedule again and generate days up to the current one
+
+        :param state: see __getstate__
+        :return:
+        """
+        number = state.pop("current_day")
+        self.__dict__.update(state)
+        if self.rng is None:
+            self.rng = random
+        if self.luck is None:
+            self.luck = random
+        if self.timeline_rng is None:
+            self.timeline_rng = random
+        self.current_day = None
+        self._days = iter(())
+        self._source = None
+        if self._plan and number is not None:
+            method, args = self._plan
+            getattr(self, method)(*args)
+            while self.current_day.number < number:
+                self.current_day = next(self._days)
+
+    def set_outcomes(self, outcomes):
+        """ OutcomeMatrix of the matches, including the ones of the current day that are
+        already created, e.g. regenerated by __setstate__
+
+        :param outcomes: OutcomeMatrix or None
+        :return:
+        """
+        self.outcomes = outcomes
+        if self.current_day is not None:
+            for match in self.current_day.matches:
+                match.outcomes = outcomes
+
+    def display(self, name):
+        """
+
+        :param name:
+        :return:
+        """
+        LOGGER.debug(msg="-------------- {0} Schedule: --------------".format(name))
+        for day in self._source() if self._source else ():
+            for home_team, away_team in day.fixtures():
+                home = home_team.name
+                away = away_team.name
+                LOGGER.debug(msg="Day {0} - Match: {1} vs {2}".format(day.number, home, away))
+        LOGGER.debug("")
+
+    def reset(self):
+        """
+
+        :return:
+        """
+        self.completed = False
+        self.current_day = None
+        self.length = 0
+        self._days = iter(())
+        self._source = None
+        self._plan = None
+
+    def _start(self, source, length):
+        """ Make the first day current, the others are generated when the previous one is
+        over and the schedule only keeps a reference to the current one
+
+        :param source: function returning a generator of days
+        :param length: number of days
+        :return:
+        """
+        self._source = source
+        self.length = length
+        self._days = source()
+        self.current_day = next(self._days)
+
+    def play(self, minutes):
+        """
+
+        :param minutes:
+        :return:
+        """
+        if self.engine:
+            self._play_batch(minutes)
+        else:
+            self._play_matches(minutes)
+        if self.current_day.number < self.length:
+            self.current_day = next(self._days)
+        else:
+            self.completed = True
+
+    def _play_matches(self, minutes):
+        """ Play matches of the current day one by one
+
+        :param minutes:
+        :return:
+        """
+        for match in self.current_day.attach(self._new_match):
+            if match.series and match.series.is_over:
+                continue
+            if minutes > 0:
+                match.play(minutes)
+                match.update(self.standings)
+            else:
+                match.play_winner()
+                self._update_series(match)
+
+    def _new_match(self, home_team, away_team):
+        """
+
+        :param home_team:
+        :param away_team:
+        :return: Match with the generators, events and distributions of the schedule
+        """
+        return Match(home_team, away_team, self.rng, self.events, self.distributions,
+                     self.outcomes, self.luck, self.timeline_rng)
+
+    def _update_series(self, match):
+        """
+
+        :param match: playoff match that has a winner
+        :return:
+        """
+        match.series.update(match.winner)
+        if match.series.is_over and self.events.series_decided:
+            self.events.emit("series_decided", match.series)
+
+    def _play_batch(self, minutes):
+        """ Play all matches of the current day with the batch engine
+
+        :param minutes:
+        :return:
+        """
+        matches = [match for match in self.current_day.attach(self._new_match)
+                   if not (match.series and match.series.is_over)]
+        if minutes > 0:
+            self.engine.play(matches, minutes, self.distributions, self.outcomes)
+            for match in matches:
+                match.update(self.standings)
+            return
+        self.engine.play(matches, 90, self.distributions, self.outcomes)
+        tied = [match for match in matches if match.loser is None]
+        self.engine.play(tied, 30, self.distributions, self.outcomes)
+        self.engine.penalty_kicks([match for match in tied if match.loser is None])
+        for match in matches:
+            self._update_series(match)
+
+    def playoffs(self, series_list, series_length):
+        """ Games of a day are created when the day comes, only for series not over yet
+
+        :param series_list:
+        :param series_length:
+        :return:
+        """
+        def days():
+            for idx in range(1, series_length + 1):
+                new_day = Day(idx)
+                for series in series_list:
+                    if series.is_over:
+                        continue
+                    if (idx - 1) % 2:
+                        match = self._new_match(series.team2, series.team1)
+                    else:
+                        match = self._new_match(series.team1, series.team2)
+                    if series_length == 1:
+                        # It's the final
+                        match.disable_home_advantage()
+                    match.series = series
+                    new_day.add(match)
+                yield new_day
+        self._plan = ("playoffs", (series_list, series_length))
+        self._start(days, series_length)
+
+    def round_robin(self, teams):
+        """ Fixtures come from round_robin_template, matches are created when a day is played
+
+        :param teams:
+        :return:
+        """
+        teams = tuple(teams)
+        template = round_robin_template(len(teams))
+
+        def days():
+            for number, pairs in enumerate(template, 1):
+                new_day = Day(number)
+                new_day.add_fixtures(teams, pairs)
+                yield new_day
+        self._plan = ("round_robin", (teams,))
+        self._start(days, len(template))
+
+
+class Day(object):
+    """
+    Description here
+    """
+
+    def __init__(self, number):
+        """
+
+        :param number:
+        """
+        self.number = number
+        self.matches = []
+        # fixtures without a match yet, see attach()
+        self.teams = ()
+        self.pairs = ()
+
+    def add(self, match):
+        """
+
+        :param match:
+        :return:
+        """
+        self.matches.append(match)
+
+    def add_fixtures(self, teams, pairs):
+        """
+
+        :param teams:
+        :param pairs: (home team index, away team index) in teams
+        :return:
+        """
+        self.teams = teams
+        self.pairs = pairs
+
+    def fixtures(self):
+        """
+
+        :return: (home team, away team) of all games of the day
+        """
+        return [(match.home_team, match.away_team) for match in self.matches] + \
+            [(self.teams[home], self.teams[away]) for home, away in self.pairs]
+
+    def attach(self, new_match):
+        """ Create the matches of the fixtures that do not have one yet
+
+        :param new_match: function creating a Match from home and away teams
+        :return: matches of the day
+        """
+        if self.pairs:
+            self.matches += [new_match(self.teams[home], self.teams[away])
+                             for home, away in self.pairs]
+            self.pairs = ()
+        return self.matches
+
+
+class Series(object):
+    """
+    Description here
+    """
+
+    def __init__(self, team1, team2, length):
+        """
+
+        :param team1:
+        :param team2:
+        :param length:
+        """
+
+        self.team1 = team1
+        self.team2 = team2
+        # wins are counted per series
+        self.team1.series_wins = 0
+        self.team2.series_wins = 0
+        self.played = 0
+        self.length = length
+        self.is_over = False
+        self.winner = None
+        self.loser = None
+
+    def update(self, winner):
+        """
+
+        :param winner:
+        :return:
+        """
+        self.played += 1
+        winner.series_wins += 1
+        wcount = abs(self.team1.series_wins - self.team2.series_wins)
+        threshold = (self.length + 1) / 2
+        if self.played == self.length or wcount == threshold:
+            self.is_over = True
+            if self.team1.series_wins > self.team2.series_wins:
+                self.winner = self.team1
+                self.loser = self.team2
+            else:
+                self.winner = self.team2
+                self.loser = self.team1
+
+
+class AntitheticRandom(random.Random):
+    """
+    random.Random drawing 1 - u for every uniform u of the same seed: a season played
+    with it is the antithetic twin of the season played with random.Random
+    """
+
+    def random(self):
+        """
+
+        :return: uniform in (0, 1]
+        """
+        return 1.0 - super().random()
+
+
+class Match(object):
+    """
+    Description here
+    """
+
+    def __init__(self, home_team, away_team, rng=random, events=None, distributions=None,
+                 outcomes=None, luck=None, timeline_rng=None):
+        """
+
+        :param home_team:
+        :param away_team:
+        :param rng: random number generator, random module or random.Random
+        :param events: Events
+        :param distributions: DistributionRegistry of the league
+        :param outcomes: OutcomeMatrix to draw the result with a single uniform, if any
+        :param luck: random number generator of the luck factors, rng if None
+        :param timeline_rng: random number generator of the goal minutes, rng if None
+        """
+        self.home_team = home_team
+        self.away_team = away_team
+        self.rng = rng
+        self.luck = luck if luck is not None else rng
+        self.timeline_rng = timeline_rng if timeline_rng is not None else rng
+        self.outcomes = outcomes
+        self.events = events if events is not None else Events()
+        self.score = Score(rng, distributions)
+        self.winner = None
+        self.loser = None
+        self.series = None
+        # strengths before and after the luck factor, and result of the last game played
+        self.strengths = None
+        self.result = None
+        self.played = False
+        self.extra_time = False
+        # (home, away) penalty kicks scored in a shootout
+        self.penalties = None
+        # (minute, side) of the goals of the periods drawn so far, see timeline()
+        self.goals = []
+        self.timed_periods = 0
+        self.goals_emitted = 0
+        self.__home_advantage = True
+
+    # draw unconditioned scores until one matches the result, kept for comparison
+    rejection_sampling = False
+
+    def disable_home_advantage(self):
+        """
+
+        """
+        self.__home_advantage = False
+
+    @property
+    def home_advantage(self):
+        """
+
+        :return: whether home team strength doubles
+        """
+        return self.__home_advantage
+
+    def play(self, minutes, home_advantage=True):
+        """
+        Each team has a strength. Home team strength is doubled before game.
+        For each team, strength is "adjusted" by picking a random number between zero and team strength.
+        This gives a chance to ay team to win a game
+        Strength ratio is computed as Home team strength divided by Away team strength.
+        If strength ratio is greater than 2, then Home team wins 
+        If strength ratio is smaller than 0.5, then Away team wins 
+        A tie will occur otherwise.
+        With an OutcomeMatrix the result is drawn from the exact probabilities of the above.
+
+        :param minutes:
+        :return:
+        """
+        if self.outcomes is not None:
+            result = self.__draw_result()
+        else:
+            strength1 = self.home_team.strength
+            strength2 = self.away_team.strength
+            if self.__home_advantage:
+                strength1 *= 2
+            # Luck factor
+            adjusted1 = self.luck.uniform(0, strength1)
+            adjusted2 = self.luck.uniform(0, strength2)
+            self.strengths = (strength1, strength2, adjusted1, adjusted2)
+            # Relative strength
+            total_strength = adjusted1 + adjusted2
+            rel_strength1 = adjusted1 / total_strength
+            rel_strength2 = adjusted2 / total_strength
+            rel_strength_ratio = rel_strength1 / rel_strength2
+            if rel_strength_ratio > 2:
+                result = "home"
+            elif rel_strength_ratio < 0.5:
+                result = "away"
+            else:
+                result = "draw"
+        self.result = result
+        score = self.__get_score(result=result, minutes=minutes)
+        self.set_score(score, minutes)
+
+    def __draw_result(self):
+        """ Result from a single uniform and the exact probabilities of the OutcomeMatrix
+
+        :return: "home", "away" or "draw"
+        """
+        home, _, away = self.outcomes.probabilities(self.home_team, self.away_team,
+                                                    self.__home_advantage)
+        roll = self.luck.random()
+        if roll < home:
+            return "home"
+        if roll >= 1 - away:
+            return "away"
+        return "draw"
+
+    def set_score(self, score, minutes):
+        """ Record the score of a game, and the resulting winner and loser
+
+        :param score: (home, away)
+        :param minutes: 90 or 30 for extra time
+        :return:
+        """
+        self.record_score(score, minutes)
+        self.emit_played(minutes)
+
+    def record_score(self, score, minutes):
+        """ set_score without the events, see BatchEngine.play
+
+        :param score: (home, away)
+        :param minutes: 90 or 30 for extra time
+        :return:
+        """
+        self.played = True
+        if minutes == 30:
+            self.extra_time = True
+            self.score.update(name="extra_time", score=score)
+        else:
+            self.score.update(name="regular_time", score=score)
+        if self.score.home > self.score.away:
+            self.winner = self.home_team
+            self.loser = self.away_team
+        elif self.score.home < self.score.away:
+            self.winner = self.away_team
+            self.loser = self.home_team
+        else:
+            self.winner = None
+            self.loser = None
+
+    def emit_played(self, minutes):
+        """ Goals not emitted yet, then the match
+
+        :param minutes: 90 or 30 for extra time
+        :return:
+        """
+        if self.events.goal_scored:
+            teams = (self.home_team.name, self.away_team.name)
+            goals = self.timeline()
+            for minute, side in goals[self.goals_emitted:]:
+                self.events.emit("goal_scored", self, minute, teams[side])
+            self.goals_emitted = len(goals)
+        if self.events.match_played:
+            self.events.emit("match_played", self, minutes)
+
+    def timeline(self):
+        """ Goal minutes are drawn the first time they are asked for, a period at a time,
+        so matches nobody looks at cost nothing per goal
+
+        :return: list of (minute, side) of the goals, side 0 for home and 1 for away
+        """
+        periods = self.score.periods
+        if self.timed_periods < len(periods):
+            self.goals.extend(goal_timeline(periods[self.timed_periods:], self.timeline_rng))
+            self.timed_periods = len(periods)
+        return self.goals
+
+    def __get_score(self, result, minutes):
+        """
+
+        :param result:
+        :param minutes:
+        :return:
+        """
+        if minutes == 30:
+            name = "extra_time"
+        else:
+            name = "regular_time"
+        if not self.rejection_sampling:
+            return self.score.generate(name, result)
+        while True:
+            score = self.score.generate(name)
+            winner = self.score.get_winner(score)
+            if winner == result:
+                return score
+
+    def update(self, standings=None):
+        """
+
+        :param standings: Standings to record the match in
+        :return:
+        """
+        if self.score.home > self.score.away:
+            home_points, away_points = 3, 0
+        elif self.score.home == self.score.away:
+            home_points, away_points = 1, 1
+        else:
+            home_points, away_points = 0, 3
+        self.home_team.points += home_points
+        self.away_team.points += away_points
+        if standings is not None:
+            standings.record(self, home_points, away_points)
+
+    def play_winner(self):
+        """
+
+        :return:
+        """
+        self.play(90)
+        if self.loser is None:
+            self.play(30)
+            if self.loser is None:
+                self.penalty_kicks()
+
+    def penalty_kicks(self):
+        """ Penalty shootout, see penalty_shootout
+
+        :return:
+        """
+        self.set_penalties(*penalty_shootout(self.rng))
+
+    def set_penalties(self, home, away):
+        """ Record a shootout and its winner and loser
+
+        :param home: kicks scored by the home team
+        :param away: kicks scored by the away team
+        :return:
+        """
+        # kicks are kept apart from the goals scored in play
+        self.penalties = (home, away)
+        if home > away:
+            self.winner = self.home_team
+            self.loser = self.away_team
+        else:
+            self.winner = self.away_team
+            self.loser = self.home_team
+        if self.events.match_played:
+            self.events.emit("match_played", self, 0)
+
+
+class Score(object):
+    """
+    Description here
+    """
+
+    def __init__(self, rng=random, distributions=None):
+        """
+
+        :param rng: random number generator, random module or random.Random
+        :param distributions: DistributionRegistry of the league
+        """
+        self.home = 0
+        self.away = 0
+        self.rng = rng
+        self.distributions = distributions
+        # (offset, minutes, home goals, away goals) of each period, see goal_timeline
+        self.periods = []
+
+    def generate(self, name, result=None):
+        """
+
+        :param name: DB name
+        :param result: "home", "away" or "draw" to get a score with that outcome
+        :return:
+        """
+        roll = self.rng.uniform(0, 1.0)
+        return self.distributions[name].sample(roll, result)
+
+    @staticmethod
+    def get_winner(score):
+        """
+
+        :param score: (home, away)
+        :return:
+        """
+        home, away = score
+        if home > away:
+            res = "home"
+        elif away > home:
+            res = "away"
+        else:
+            res = "draw"
+        return res
+
+    def update(self, name, score):
+        """
+
+        :param name: DB name
+        :param score: (home, away)
+        :return:
+        """
+        self.distributions[name].record(score)
+        home, away = score
+        self.home += home
+        self.away += away
+        self.periods.append(PERIODS[name] + (home, away))
+
+    def display(self, home_team, away_team):
+        """
+
+        :param home_team:
+        :param away_team:
+        :return:
+        """
+        LOGGER.info(msg="{0} {1}: {2} {3}".format(home_team, self.home, away_team, self.away))
+
+
+class Interrupted(RuntimeError):
+    """
+    Raised where a run stops once it is saved after SIGINT or SIGTERM, see Checkpoint
+    """
+
+    def __init__(self, signum, path):
+        """
+
+        :param signum: number of the signal received
+        :param path: snapshot file
+        """
+        super().__init__("Error: run interrupted by signal {0}, snapshot saved in "
+                         "{1}".format(signum, path))
+        self.signum = signum
+
+
+class Checkpoint(object):
+    """
+    Snapshot file of a run, written every interval seconds and when SIGINT or SIGTERM is
+    received. Runs call update() where their state is consistent, at the end of a day or
+    of a season, and stop there with Interrupted once an interrupted run is saved.
+    """
+
+    def __init__(self, path, interval=300):
+        """
+
+        :param path: snapshot file, gzipped pickle
+        :param interval: seconds between snapshots
+        """
+        self.path = path
+        self.interval = interval
+        self.saved = time.time()
+        # number of the signal received, if any
+        self.interrupted = None
+
+    def handle_signals(self):
+        """ Take over SIGINT and SIGTERM, the run is saved and stops at the next update()
+
+        :return:
+        """
+        signal.signal(signal.SIGINT, self._signal_handler)
+        signal.signal(signal.SIGTERM, self._signal_handler)
+
+    def _signal_handler(self, signum, frame):
+        """
+
+        :param signum: signal number
+        :param frame: frame with the stack
+        """
+        LOGGER.warning(msg="Interrupt handler called: {0}, saving a snapshot".format(signum))
+        self.interrupted = signum
+
+    def update(self, kind, state):
+        """ Save a snapshot if one is due, stop the run if it was interrupted
+
+        :param kind: "league" or "monte_carlo"
+        :param state: function returning the object to save
+        :return:
+        """
+        if self.interrupted is None and time.time() - self.saved < self.interval:
+            return
+        self.save(kind, state())
+        if self.interrupted is not None:
+            LOGGER.warning(msg="Snapshot saved in {0}, stopping".format(self.path))
+            raise Interrupted(self.interrupted, self.path)
+
+    def save(self, kind, state):
+        """ Replace the snapshot file, a crash while writing leaves the previous one
+
+        :param kind: "league" or "monte_carlo"
+        :param state: object to save
+        :return:
+        """
+        tmp_path = self.path + ".tmp"
+        import gzip
+        import pickle
+        with gzip.open(tmp_path, "wb") as stream:
+            pickle.dump({"kind": kind, "state": state}, stream, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        self.saved = time.time()
+
+    def load(self, kind):
+        """
+
+        :param kind: "league" or "monte_carlo"
+        :return: saved object, None if there is no snapshot
+        """
+        if not os.path.exists(self.path):
+            return None
+        import gzip
+        import pickle
+        with gzip.open(self.path, "rb") as stream:
+            snapshot = pickle.load(stream)
+        if snapshot["kind"] != kind:
+            raise RuntimeError("Error: {0} is a {1} snapshot, not "
+                               "{2}".format(self.path, snapshot["kind"], kind))
+        LOGGER.info(msg="Resuming from {0}".format(self.path))
+        return snapshot["state"]
+
+    def remove(self):
+        """ Remove the snapshot of a run that is over
+
+        :return:
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class MonteCarlo(object):
+    """
+    Plays the same league for many seasons and counts how each one ended for every team
+    """
+
+    # outcomes counted for each team
+    OUTCOMES = ("division", "playoffs", "conference", "league", "relegation")
+
+    # seasons per worker task of run_parallel when there is a checkpoint
+    CHECKPOINT_SEASONS = 100
+
+    # outcome whose standard errors stop a run at the requested precision
+    TARGET = "league"
+
+    # seasons per worker task of run_parallel when there is a precision, it is checked
+    # after each task so tasks do not depend on the number of workers
+    PRECISION_SEASONS = 50
+
+    def __init__(self, league, antithetic=False):
+        """
+
+        :param league: loaded League, reset before every season
+        :param antithetic: play seasons in pairs, the second one with 1 - u for every luck
+                           uniform u of the first one
+        """
+        self.league = league
+        self.antithetic = antithetic
+        self.seasons = 0
+        self.elapsed = 0.0
+        self.seed = None
+        # luck seed of the current pair of antithetic seasons, see play_season()
+        self.pair_seed = None
+        # [first, last) ranges of the seasons played, sorted
+        self.done = []
+        # Checkpoint written at the end of each season, if any
+        self.checkpoint = None
+        # {team name: {outcome: count}}
+        self.counts = {}
+        for conf in league.conferences.values():
+            for div in conf.divisions.values():
+                for team in div.roster:
+                    self.counts[team.name] = dict.fromkeys(self.OUTCOMES, 0)
+        # outcome indicators by season, or by pair of antithetic seasons
+        self.stats = RunningStats(self.counts, len(self.OUTCOMES))
+
+    @staticmethod
+    def season_seed(seed, season):
+        """ Seed of a season, it only depends on the master seed and the season number
+
+        :param seed: master seed
+        :param season: season number
+        :return: integer seed
+        """
+        return random.Random("{0}-{1}".format(seed, season)).getrandbits(64)
+
+    def run(self, seasons, seed=None, first=0, precision=None):
+        """ Play seasons, logging is raised to WARNING while playing
+
+        :param seasons: number of seasons, at most if there is a precision
+        :param seed: master seed, each season gets its own generator if set
+        :param first: number of the first season, for seeding
+        :param precision: stop once the standard errors of the TARGET odds are below it
+        :return:
+        """
+        self._check_seed(seed)
+        level = LOGGER.level
+        LOGGER.setLevel(max(level, logging.WARNING))
+        start = time.time()
+        try:
+            for todo_first, todo_last in self._todo(first, first + seasons):
+                for season in range(todo_first, todo_last):
+                    self.play_season(season, seed)
+                    self._played(season, season + 1)
+                    now = time.time()
+                    self.elapsed += now - start
+                    start = now
+                    self.save_checkpoint()
+                    if self.precise(precision):
+                        return
+        finally:
+            self.elapsed += time.time() - start
+            LOGGER.setLevel(level)
+
+    def play_season(self, season, seed=None):
+        """ Play and record a season. Antithetic pairs share their luck seed, derived
+        from the master seed and the first season of the pair.
+
+        :param season: season number
+        :param seed: master seed
+        :return: see record()
+        """
+        league = self.league
+        league.reset()
+        league.season = season
+        if self.antithetic:
+            if seed is not None:
+                self.pair_seed = self.season_seed(seed, season - season % 2)
+            elif season % 2 == 0 or self.pair_seed is None:
+                self.pair_seed = random.getrandbits(64)
+            league.seed(self.season_seed(self.pair_seed, season), self.pair_seed,
+                        season % 2 == 1)
+        elif seed is not None:
+            league.seed(self.season_seed(seed, season))
+        league.initialize()
+        league.play()
+        return self.record(end=not self.antithetic or season % 2 == 1)
+
+    def precise(self, precision):
+        """
+
+        :param precision: largest standard error, None to play all seasons
+        :return: whether the standard errors of the TARGET odds of all teams are below
+                 precision
+        """
+        if precision is None:
+            return False
+        return self.stats.precise(self.OUTCOMES.index(self.TARGET), precision)
+
+    def run_parallel(self, league_file, seasons, workers, seed=None, precision=None):
+        """ Play seasons in a pool of processes, each loading its own copy of the league.
+        Results of the tasks are taken in the order they were submitted, so that with a
+        seed they do not depend on the number of workers nor on their timing.
+
+        :param league_file: yaml file the league was loaded from
+        :param seasons: number of seasons, at most if there is a precision
+        :param workers: number of processes
+        :param seed: master seed
+        :param precision: stop once the standard errors of the TARGET odds are below it,
+                          checked after each task, at the end of a pair if antithetic
+        :return:
+        """
+        import concurrent.futures
+        self._check_seed(seed)
+        engine = "batch" if self.league.engine else "match"
+        chunk = max(1, -(-seasons // workers))
+        if precision is not None:
+            chunk = self.PRECISION_SEASONS
+        if self.checkpoint is not None:
+            chunk = min(chunk, self.CHECKPOINT_SEASONS)
+        if self.antithetic:
+            # tasks play whole pairs
+            chunk += chunk % 2
+        start = time.time()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            # (future, first, last) in submission order
+            tasks = []
+            for todo_first, todo_last in self._todo(0, seasons):
+                for first in range(todo_first, todo_last, chunk):
+                    last = min(first + chunk, todo_last)
+                    future = executor.submit(_monte_carlo_worker, league_file, engine,
+                                             first, last - first, seed,
+                                             self.league.fast_outcomes, self.antithetic)
+                    tasks.append((future, first, last))
+            futures = [future for future, _, _ in tasks]
+            try:
+                for future, first, last in tasks:
+                    self.merge(*future.result())
+                    self._played(first, last)
+                    now = time.time()
+                    self.elapsed += now - start
+                    start = now
+                    self.save_checkpoint()
+                    if (not self.antithetic or last % 2 == 0) and self.precise(precision):
+                        for other in futures:
+                            other.cancel()
+                        break
+            except BaseException:
+                # do not wait for seasons that have not started
+                for future in futures:
+                    future.cancel()
+                raise
+        self.elapsed += time.time() - start
+
+    def _check_seed(self, seed):
+        """ Seasons already played must have been played with the same seed
+
+        :param seed: master seed
+        :return:
+        """
+        if self.done and seed != self.seed:
+            raise RuntimeError("Error: seasons were played with seed {0}, "
+                               "not {1}".format(self.seed, seed))
+        self.seed = seed
+
+    def _todo(self, first, last):
+        """
+
+        :param first: first season
+        :param last: last season, excluded
+        :return: [first, last) ranges of the seasons not played yet
+        """
+        todo = []
+        for done_first, done_last in self.done:
+            if done_first > first:
+                todo.append((first, min(done_first, last)))
+            first = max(first, done_last)
+            if first >= last:
+                break
+        if first < last:
+            todo.append((first, last))
+        return todo
+
+    def _played(self, first, last):
+        """ Add seasons to the ranges played
+
+        :param first: first season
+        :param last: last season, excluded
+        :return:
+        """
+        done = []
+        for done_first, done_last in sorted(self.done + [(first, last)]):
+            if done and done_first <= done[-1][1]:
+                done[-1] = (done[-1][0], max(done[-1][1], done_last))
+            else:
+                done.append((done_first, done_last))
+        self.done = done
+
+    def snapshot(self):
+        """
+
+        :return: state of the run, see restore()
+        """
+        return {"seed": self.seed, "seasons": self.seasons, "elapsed": self.elapsed,
+                "counts": self.counts, "done": self.done, "stats": self.stats,
+                "pair_seed": self.pair_seed}
+
+    def restore(self, snapshot):
+        """ Continue a run, seasons already played are skipped by run and run_parallel
+
+        :param snapshot: see snapshot()
+        :return:
+        """
+        self.seed = snapshot["seed"]
+        self.seasons = snapshot["seasons"]
+        self.elapsed = snapshot["elapsed"]
+        self.counts = snapshot["counts"]
+        self.done = snapshot["done"]
+        self.stats = snapshot["stats"]
+        self.pair_seed = snapshot["pair_seed"]
+
+    def save_checkpoint(self):
+        """ Write a snapshot of the run if the checkpoint is due, at the end of a season
+
+        :return:
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.update("monte_carlo", self.snapshot)
+
+    def merge(self, seasons, counts, stats=None):
+        """ Add counts from another run of the same league
+
+        :param seasons: number of seasons of the other run
+        :param counts: {team name: {outcome: count}}
+        :param stats: RunningStats of the other run, if any
+        :return:
+        """
+        self.seasons += seasons
+        for name, outcomes in counts.items():
+            for outcome, count in outcomes.items():
+                self.counts[name][outcome] += count
+        if stats is not None:
+            self.stats.merge(stats)
+
+    def record(self, end=True):
+        """ Count the outcomes of the season just played
+
+        :param end: whether the season ends a block of the running statistics
+        :return: {team name: [1 if the team got the outcome else 0 for each of OUTCOMES]}
+                 of the teams with an outcome
+        """
+        self.seasons += 1
+        values = {}
+        for name, outcome in self._outcomes():
+            self.counts[name][outcome] += 1
+            if name not in values:
+                values[name] = [0] * len(self.OUTCOMES)
+            values[name][self.OUTCOMES.index(outcome)] = 1
+        self.stats.add(values, end)
+        return values
+
+    def _outcomes(self):
+        """
+
+        :return: generator of (team name, outcome) of the season just played
+        """
+        league = self.league
+        for conf in league.conferences.values():
+            for div in conf.divisions.values():
+                yield div.teams[0].name, "division"
+                if league.playoffs:
+                    for team in div.teams[0:int(len(div.teams)/2)]:
+                        yield team.name, "playoffs"
+            if conf.champion is not None:
+                yield conf.champion.name, "conference"
+            for team in conf.relegated or []:
+                yield team.name, "relegation"
+        if league.champion is not None:
+            yield league.champion.name, "league"
+
+    def probabilities(self):
+        """
+
+        :return: {team name: {outcome: probability}}
+        """
+        return {name: {outcome: float(count) / self.seasons
+                       for outcome, count in counts.items()}
+                for name, counts in self.counts.items()}
+
+    def display(self):
         """
 
-        :param name:
+        :return:
         """
-        self.name = name
-        self.strength = 0
-        self.points = 0
-        self.series_wins = 0
+        LOGGER.info(msg="Monte Carlo: {0} seasons in {1:.2f}s, {2:.1f} "
+                    "seasons/second".format(self.seasons, self.elapsed,
+                                            self.seasons / self.elapsed if self.elapsed else 0))
+        LOGGER.info(msg="{:20s} {:>10s} {:>10s} {:>10s} {:>10s} "
+                    "{:>10s} {:>10s}".format("Team", *self.OUTCOMES + ("std_error",)))
+        probabilities = self.probabilities()
+        errors = self.stats.standard_errors()
+        target = self.OUTCOMES.index(self.TARGET)
+        for team in sorted(probabilities, key=lambda name: -probabilities[name]["league"]):
+            LOGGER.info(msg="{:20s} {:10.3f} {:10.3f} {:10.3f} {:10.3f} "
+                        "{:10.3f} {:10.4f}".format(team, *[probabilities[team][outcome]
+                                                           for outcome in self.OUTCOMES] +
+                                                   [errors[team][target]]))
+        LOGGER.info("")
 
 
-class Schedule(object):
+class RunningStats(object):
     """
-    Description here
+    Running means and standard errors of values of each team, for example outcome
+    indicators. Seasons are grouped in independent blocks, one season each or a pair
+    of antithetic seasons, and the standard errors are the ones of the block means.
     """
 
-    def __init__(self):
-        """
-        Description here
+    # blocks before standard errors are trusted to stop a run
+    MIN_BLOCKS = 30
+
+    def __init__(self, names, size):
         """
-        self.days = []
-        self.current_day = None
-        self.completed = False
-        self.series_list = []
 
-    def display(self, name):
+        :param names: team names
+        :param size: number of values of each team
+        """
+        self.size = size
+        self.blocks = 0
+        self.sums = {name: [0.0] * size for name in names}
+        self.squares = {name: [0.0] * size for name in names}
+        # {team name: values} of the seasons of the current block
+        self.pending = {}
+        self.pending_seasons = 0
+
+    def add(self, values, end=True):
         """
 
-        :param name:
+        :param values: {team name: list of size values} of a season, zero for teams
+                       missing
+        :param end: whether the season ends a block
         :return:
         """
-        LOGGER.debug(msg="-------------- {0} Schedule: --------------".format(name))
-        for day in self.days:
-            for match in day.matches:
-                home = match.home_team.name
-                away = match.away_team.name
-                LOGGER.debug(msg="Day {0} - Match: {1} vs {2}".format(day.number, home, away))
-        LOGGER.debug("")
+        for name, row in values.items():
+            pending = self.pending.setdefault(name, [0.0] * self.size)
+            for idx, value in enumerate(row):
+                pending[idx] += value
+        self.pending_seasons += 1
+        if end:
+            for name, row in self.pending.items():
+                sums = self.sums[name]
+                squares = self.squares[name]
+                for idx, value in enumerate(row):
+                    mean = value / self.pending_seasons
+                    sums[idx] += mean
+                    squares[idx] += mean * mean
+            self.blocks += 1
+            self.pending = {}
+            self.pending_seasons = 0
+
+    def merge(self, other):
+        """ Add the blocks of another run, its pending seasons are left out
+
+        :param other: RunningStats
+        :return:
+        """
+        self.blocks += other.blocks
+        for name in other.sums:
+            for idx in range(self.size):
+                self.sums[name][idx] += other.sums[name][idx]
+                self.squares[name][idx] += other.squares[name][idx]
 
-    def reset(self):
+    def means(self):
         """
 
-        :return:
+        :return: {team name: list of mean values}
         """
-        self.completed = False
-        self.days = []
-        self.current_day = None
+        return {name: [value / self.blocks if self.blocks else 0.0 for value in sums]
+                for name, sums in self.sums.items()}
 
-    def play(self, minutes):
+    def standard_errors(self):
         """
 
-        :param minutes:
-        :return:
+        :return: {team name: list of standard errors of the means}, inf before two blocks
         """
-        LOGGER.info(msg="Day: {0}\n".format(self.current_day.number))
-        for match in self.current_day.matches:
-            if match.series and match.series.is_over:
-                LOGGER.debug(msg="Series is over, Winner: {0}\n".format(match.series.winner.name))
+        count = self.blocks
+        errors = {}
+        for name, sums in self.sums.items():
+            if count < 2:
+                errors[name] = [float("inf")] * self.size
                 continue
-            if minutes > 0:
-                LOGGER.debug(msg="Starting {0}-minute game ...".format(minutes))
-                match.play(minutes)
-                match.update()
-            else:
-                LOGGER.debug("Starting game ...")
-                match.play_winner()
-                match.series.update(match.winner)
-            LOGGER.debug("Game over ...")
-            LOGGER.info("")
-        if self.current_day.number < len(self.days):
-            LOGGER.info(msg="Day: {0} of {1}\n".format(self.current_day.number, len(self.days)))
-            self.current_day = self.days[self.current_day.number]
-        else:
-            self.completed = True
+            errors[name] = [
+                math.sqrt(max(0.0, square - value * value / count) / (count - 1) / count)
+                for value, square in zip(sums, self.squares[name])]
+        return errors
 
-    def playoffs(self, series_list, series_length):
+    def max_error(self, idx):
         """
 
-        :param series_list:
-        :param series_length:
-        :return:
+        :param idx: index of the value
+        :return: largest standard error of the value over all teams
         """
-        for idx in range(1, series_length + 1):
-            new_day = Day(idx)
-            self.days.append(new_day)
-            for series in series_list:
-                if (idx - 1) % 2:
-                    match = Match(series.team2, series.team1)
-                else:
-                    match = Match(series.team1, series.team2)
-                if series_length == 1:
-                    # It's the final
-                    match.disable_home_advantage()
-                match.series = series
-                new_day.add(match)
-        self.current_day = self.days[0]
+        return max(errors[idx] for errors in self.standard_errors().values())
 
-    def round_robin(self, teams):
+    def precise(self, idx, precision):
         """
 
-        :param teams:
-        :return:
+        :param idx: index of the value
+        :param precision: largest standard error
+        :return: whether there are enough blocks and all standard errors of the value are
+                 below precision
         """
+        return self.blocks >= self.MIN_BLOCKS and self.max_error(idx) <= precision
 
-        second_half = []
-        rotating_table = {}
-        for team_idx in range(0, len(teams)):
-            rotating_table[team_idx + 1] = teams[team_idx]
-            team_idx += 1
-        day = 1
-        while day <= len(teams) - 1:
-            # first half of the season
-            new_day = Day(day)
-            self.days.append(new_day)
-            # second half
-            day2 = day + len(teams) - 1
-            associated_day = Day(day2)
-            second_half.append(associated_day)
-            match = 1
-            while match <= len(teams) / 2:
-                if match == 1:
-                    team1 = rotating_table[match]
-                    team2 = rotating_table[match + 1]
-                else:
-                    team1 = rotating_table[match + 1]
-                    team2 = rotating_table[len(teams) - match + 2]
-                new_match = Match(team1, team2)
-                new_day.add(new_match)
-                associated_match = Match(team2, team1)
-                associated_day.add(associated_match)
-                match += 1
-            day += 1
-            # rotate table
-            curr_val = 0
-            for entry in rotating_table.keys():
-                if entry == 2:
-                    curr_val = rotating_table[entry]
-                    rotating_table[entry] = rotating_table[len(teams)]
-                elif entry > 2:
-                    stored_val = rotating_table[entry]
-                    rotating_table[entry] = curr_val
-                    curr_val = stored_val
-
-        self.days += second_half
-        self.current_day = self.days[0]
 
-
-class Day(object):
+class Comparison(object):
     """
-    Description here
+    Difference of the outcome probabilities of two leagues with the same teams, for
+    example two strength sets. Both play every season under the same luck draws (common
+    random numbers), so the luck mostly cancels out of the difference.
     """
 
-    def __init__(self, number):
+    def __init__(self, league, other, antithetic=False):
         """
 
-        :param number:
+        :param league: loaded League
+        :param other: loaded League with the same conferences, divisions and teams
+        :param antithetic: see MonteCarlo
         """
-        self.number = number
-        self.matches = []
+        self.runs = (MonteCarlo(league, antithetic), MonteCarlo(other, antithetic))
+        if set(self.runs[0].counts) != set(self.runs[1].counts):
+            raise RuntimeError("Error: leagues {0} and {1} do not have the same "
+                               "teams".format(league.name, other.name))
+        self.antithetic = antithetic
+        self.seasons = 0
+        self.elapsed = 0.0
+        # differences of the outcome indicators, first league minus second one
+        self.stats = RunningStats(self.runs[0].counts, len(MonteCarlo.OUTCOMES))
+
+    def run(self, seasons, seed=None, precision=None):
+        """ Play each season with both leagues
+
+        :param seasons: number of seasons, at most if there is a precision
+        :param seed: master seed, a random one if None as both leagues need the same one
+        :param precision: stop once the standard errors of the differences of the
+                          MonteCarlo.TARGET odds are below it
+        :return:
+        """
+        if seed is None:
+            seed = random.getrandbits(64)
+        target = MonteCarlo.OUTCOMES.index(MonteCarlo.TARGET)
+        level = LOGGER.level
+        LOGGER.setLevel(max(level, logging.WARNING))
+        start = time.time()
+        try:
+            for season in range(self.seasons, self.seasons + seasons):
+                values, other_values = [run.play_season(season, seed) for run in self.runs]
+                differences = {}
+                for name in set(values) | set(other_values):
+                    row = values.get(name, [0] * self.stats.size)
+                    other_row = other_values.get(name, [0] * self.stats.size)
+                    differences[name] = [value - other_value
+                                         for value, other_value in zip(row, other_row)]
+                self.stats.add(differences, not self.antithetic or season % 2 == 1)
+                self.seasons += 1
+                if precision is not None and self.stats.precise(target, precision):
+                    break
+        finally:
+            self.elapsed += time.time() - start
+            LOGGER.setLevel(level)
 
-    def add(self, match):
+    def display(self):
         """
 
-        :param match:
         :return:
         """
-        self.matches.append(match)
+        LOGGER.info(msg="Comparison: {0} seasons in {1:.2f}s".format(self.seasons,
+                                                                     self.elapsed))
+        LOGGER.info(msg="{:20s} {:>10s} {:>10s} {:>10s} {:>10s}".format(
+            "Team", "first", "second", "difference", "std_error"))
+        target = MonteCarlo.OUTCOMES.index(MonteCarlo.TARGET)
+        probabilities = [run.probabilities() for run in self.runs]
+        means = self.stats.means()
+        errors = self.stats.standard_errors()
+        for team in sorted(means, key=lambda name: -abs(means[name][target])):
+            LOGGER.info(msg="{:20s} {:10.3f} {:10.3f} {:10.3f} {:10.4f}".format(
+                team, probabilities[0][team][MonteCarlo.TARGET],
+                probabilities[1][team][MonteCarlo.TARGET], means[team][target],
+                errors[team][target]))
+        LOGGER.info("")
 
 
-class Series(object):
+class Dynasty(object):
     """
-    Description here
+    Plays consecutive seasons of the same league. Between seasons, the relegated teams of
+    each conference swap places with the best teams of the next conference, conferences
+    being tiers in the order of the league file, and strengths are recomputed in memory
+    from the seasons of a rolling window, as the strengths of the league files are.
     """
 
-    def __init__(self, team1, team2, length):
-        """
-
-        :param team1:
-        :param team2:
-        :param length:
-        """
+    # (top N teams of the season, points), a team gets the points of the first N it is in
+    POINTS = ((2, 16), (4, 8), (8, 4), (16, 2), (32, 1))
 
-        self.team1 = team1
-        self.team2 = team2
-        self.played = 0
-        self.length = length
-        self.is_over = False
-        self.winner = None
-        self.loser = None
+    # seasons the strengths are computed from
+    WINDOW = 11
 
-    def update(self, winner):
+    def __init__(self, league, window=WINDOW):
         """
 
-        :param winner:
+        :param league: loaded League, played in this process
+        :param window: number of seasons, the strengths of the league file stand for the
+                       seasons before the first one
+        """
+        if league.workers > 1:
+            raise RuntimeError("Error: dynasty of league {0} cannot play conferences "
+                               "in workers".format(league.name))
+        self.league = league
+        self.window = window
+        self.seasons = 0
+        self.elapsed = 0.0
+        # points of the seasons of the window, {team id: points} each
+        self.history = collections.deque(maxlen=window)
+        # points of the league file strengths for one season, whatever their total
+        season_points = sum(self.points())
+        total = sum(league.store.strength)
+        self.base = [strength / total * season_points if total else 0.0
+                     for strength in league.store.strength]
+        # {team name: league titles}
+        self.titles = {}
+        # series won in the postseason of the current season, {team id: count}
+        self.wins = {}
+
+    def run(self, seasons, seed=None):
+        """ Play seasons, logging is raised to WARNING while playing
+
+        :param seasons: number of seasons
+        :param seed: master seed, each season gets its own generator if set
         :return:
         """
-        self.played += 1
-        winner.series_wins += 1
-        wcount = abs(self.team1.series_wins - self.team2.series_wins)
-        threshold = (self.length + 1) / 2
-        if self.played == self.length or wcount == threshold:
-            self.is_over = True
-            if self.team1.series_wins > self.team2.series_wins:
-                self.winner = self.team1
-                self.loser = self.team2
-            else:
-                self.winner = self.team2
-                self.loser = self.team1
-            LOGGER.debug(msg="Series is over, Winner: {0}, "
-                         "Loser: {1}".format(self.winner.name,
-                                             self.loser.name))
-
-
-class Match(object):
-    """
-    Description here
-    """
-
-    def __init__(self, home_team, away_team):
+        level = LOGGER.level
+        LOGGER.setLevel(max(level, logging.WARNING))
+        self.league.events.subscribe("series_decided", self._series_decided)
+        start = time.time()
+        try:
+            for season in range(self.seasons, self.seasons + seasons):
+                self.play_season(season, seed)
+        finally:
+            self.elapsed += time.time() - start
+            self.league.events.unsubscribe("series_decided", self._series_decided)
+            LOGGER.setLevel(level)
+
+    def play_season(self, season, seed=None):
+        """ Play a season, then promote, relegate and update the strengths
+
+        :param season: season number
+        :param seed: master seed
+        :return:
         """
-
-        :param home_team:
-        :param away_team:
+        league = self.league
+        league.reset()
+        league.season = season
+        if seed is not None:
+            league.seed(MonteCarlo.season_seed(seed, season))
+        self.wins = {}
+        league.initialize()
+        league.play()
+        self.seasons += 1
+        if league.champion is not None:
+            self.titles[league.champion.name] = self.titles.get(league.champion.name, 0) + 1
+        finish = self.finish()
+        self.history.append({team.id: points for team, points in zip(finish, self.points())})
+        self.promote(finish)
+        self.update_strengths()
+
+    def _series_decided(self, series):
         """
-        self.home_team = home_team
-        self.away_team = away_team
-        self.score = Score()
-        self.winner = None
-        self.loser = None
-        self.series = None
-        self.__home_advantage = True
 
-    def disable_home_advantage(self):
+        :param series: Series
+        :return:
         """
+        self.wins[series.winner.id] = self.wins.get(series.winner.id, 0) + 1
 
-        """
-        self.__home_advantage = False
+    def finish(self):
+        """ Teams of the season just played from first to last: playoff teams first, then
+        by series won in the postseason, then by regular season record
 
-    def play(self, minutes, home_advantage=True):
+        :return: list of Team
         """
-        Each team has a strength. Home team strength is doubled before game.
-        For each team, strength is "adjusted" by picking a random number between zero and team strength.
-        This gives a chance to ay team to win a game
-        Strength ratio is computed as Home team strength divided by Away team strength.
-        If strength ratio is greater than 2, then Home team wins 
-        If strength ratio is smaller than 0.5, then Away team wins 
-        A tie will occur otherwise.
-
-        :param minutes:
-        :return:
+        league = self.league
+        teams = []
+        playoffs = set()
+        for conf in league.conferences.values():
+            for div in conf.divisions.values():
+                teams += div.teams
+                if league.playoffs:
+                    playoffs.update(team.id for team in div.teams[0:int(len(div.teams)/2)])
+        return sorted(Standings.rank(teams),
+                      key=lambda team: (team.id not in playoffs, -self.wins.get(team.id, 0)))
+
+    def points(self):
         """
-        strength1 = self.home_team.strength
-        strength2 = self.away_team.strength
-        home_team = self.home_team.name
-        away_team = self.away_team.name
-        LOGGER.info(msg="Home Team {0} strength: {1}".format(home_team, strength1))
-        LOGGER.info(msg="Away Team {0} strength: {1}".format(away_team, strength2))
-        if self.__home_advantage:
-            strength1 *= 2
-            LOGGER.info(msg="Home Team {0} strength doubles: {1}".format(home_team, strength1))
-        # Luck factor
-        strength1 = random.uniform(0, strength1)
-        strength2 = random.uniform(0, strength2)
-        LOGGER.info(msg="Home Team {0} adjusted strength: {1}".format(home_team, strength1))
-        LOGGER.info(msg="Away Team {0} adjusted strength: {1}".format(away_team, strength2))
-        # Relative strength
-        total_strength = strength1 + strength2
-        rel_strength1 = strength1 / total_strength
-        rel_strength2 = strength2 / total_strength
-        LOGGER.info(msg="Home Team {0} relative strength: {1}".format(home_team, rel_strength1))
-        LOGGER.info(msg="Away Team {0} relative strength: {1}".format(away_team, rel_strength2))
-        rel_strength_ratio = rel_strength1 / rel_strength2
-        LOGGER.info(msg="Relative strenght ratio = {0}".format(rel_strength_ratio))
-        if rel_strength_ratio > 2:
-            result = "home"
-        elif rel_strength_ratio < 0.5:
-            result = "away"
-        else:
-            result = "draw"
-        score = self.__get_score(result=result, minutes=minutes)
-        if minutes == 30:
-            self.score.update(name="extra_time", score=score)
-            self.score.simulate_scoring(score, minutes, 90, home_team, away_team)
-        else:
-            self.score.update(name="regular_time", score=score)
-            self.score.simulate_scoring(score, minutes, 0, home_team, away_team)
-        self.score.display(home_team, away_team)
-        if self.score.home > self.score.away:
-            self.winner = self.home_team
-            self.loser = self.away_team
-        elif self.score.home < self.score.away:
-            self.winner = self.away_team
-            self.loser = self.home_team
-        else:
-            self.winner = None
-            self.loser = None
 
-    def __get_score(self, result, minutes):
+        :return: points of the teams by finish, see POINTS
         """
+        return [next((points for top, points in self.POINTS if position < top), 0)
+                for position in range(len(self.league.store))]
 
-        :param result:
-        :param minutes:
+    def promote(self, finish):
+        """ Swap the relegated teams of each conference with the best teams of the next
+        one, each team takes the place of the other one in its division
+
+        :param finish: teams by finish, see finish()
         :return:
         """
-        LOGGER.info("Result is {0}".format(result))
-        while True:
-            if minutes == 30:
-                score = self.score.generate("extra_time")
-            else:
-                score = self.score.generate("regular_time")
-            winner = self.score.get_winner(score)
-            if winner == result:
-                return score
+        conferences = list(self.league.conferences.values())
+        moves = []
+        for upper, lower in zip(conferences, conferences[1:]):
+            relegated = upper.relegated or []
+            lower_ids = set(team.id for div in lower.divisions.values() for team in div.roster)
+            promoted = [team for team in finish if team.id in lower_ids][:len(relegated)]
+            moves += zip(relegated, promoted)
+        for relegated, promoted in moves:
+            relegated_div = self._division(relegated)
+            promoted_div = self._division(promoted)
+            relegated_div.roster[relegated_div.roster.index(relegated)] = promoted
+            promoted_div.roster[promoted_div.roster.index(promoted)] = relegated
+            LOGGER.info(msg="Team {0} promoted to division {1}, team {2} relegated to "
+                        "division {3}".format(promoted.name, relegated_div.name,
+                                              relegated.name, promoted_div.name))
+
+    def _division(self, team):
+        """
 
-    def update(self):
+        :param team: Team
+        :return: Division of the team
         """
+        for conf in self.league.conferences.values():
+            for div in conf.divisions.values():
+                if team in div.roster:
+                    return div
+        raise RuntimeError("Error: team {0} is in no division".format(team.name))
+
+    def update_strengths(self):
+        """ Strength of each team, its share of the points of the window in percent
 
         :return:
         """
-        if self.score.home > self.score.away:
-            self.home_team.points += 3
-        elif self.score.home == self.score.away:
-            self.home_team.points += 1
-            self.away_team.points += 1
-        else:
-            self.away_team.points += 3
-
-    def play_winner(self):
+        store = self.league.store
+        missing = self.window - len(self.history)
+        points = [base * missing for base in self.base]
+        for season in self.history:
+            for team_id, team_points in season.items():
+                points[team_id] += team_points
+        # as in the league files, every team has the points of at least one top 32 finish,
+        # Match.play needs strengths above zero
+        points = [max(value, self.POINTS[-1][1]) for value in points]
+        total = sum(points)
+        store.strength[:] = array.array('d', [value / total * 100 for value in points])
+
+    def strengths(self):
         """
 
-        :return:
+        :return: {team name: strength}
         """
-        self.play(90)
-        if self.loser is None:
-            LOGGER.info("It's a tie, play extra time")
-            self.play(30)
-            if self.loser is None:
-                LOGGER.info("It's again a tie, penalty kicks")
-                self.penalty_kicks()
+        store = self.league.store
+        return dict(zip(store.names, store.strength))
 
-    def penalty_kicks(self):
+    def display(self):
         """
 
         :return:
         """
-        LOGGER.debug("Penalty kicks ...")
-        team1_total = 0
-        team2_total = 0
-        for i in range(1, 6):
-            team1_total += random.randint(0, 1)
-            if (5 - i) < (team2_total - team1_total):
-                self.winner = self.away_team
-                self.loser = self.home_team
-                break
-            team2_total += random.randint(0, 1)
-            if (5 - i) < (team1_total - team2_total):
-                self.winner = self.home_team
-                self.loser = self.away_team
-                break
-        self.score.home += team1_total
-        self.score.away += team2_total
-        if team1_total == team2_total:
-            while team1_total == team2_total:
-                val1 = random.randint(0, 1)
-                val2 = random.randint(0, 1)
-                team1_total += val1
-                team2_total += val2
-                self.score.home += team1_total
-                self.score.away += team2_total
-        if team1_total > team2_total:
-            self.winner = self.home_team
-            self.loser = self.away_team
-        else:
-            self.winner = self.away_team
-            self.loser = self.home_team
-        self.score.display(self.home_team.name, self.away_team.name)
+        LOGGER.info(msg="Dynasty: {0} seasons in {1:.2f}s, {2:.1f} "
+                    "seasons/second".format(self.seasons, self.elapsed,
+                                            self.seasons / self.elapsed if self.elapsed else 0))
+        LOGGER.info(msg="{:20s} {:20s} {:>10s} {:>10s}".format("Team", "Conference",
+                                                             "strength", "titles"))
+        for conf in self.league.conferences.values():
+            teams = [team for div in conf.divisions.values() for team in div.roster]
+            for team in sorted(teams, key=lambda team: -team.strength):
+                LOGGER.info(msg="{:20s} {:20s} {:10.4f} {:10d}".format(
+                    team.name, conf.name, team.strength, self.titles.get(team.name, 0)))
+        LOGGER.info("")
 
 
-class Score(object):
+def _ignore_signals():
+    """ Workers leave SIGINT and SIGTERM to the parent, which saves its checkpoint and
+    stops once the tasks running are over
+
+    :return:
     """
-    Description here
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+def _monte_carlo_worker(league_file, engine, first, seasons, seed, fast_outcomes=False,
+                        antithetic=False):
+    """ Play seasons in a worker process of MonteCarlo.run_parallel
+
+    :param league_file: yaml file with the league
+    :param engine: one of ENGINES
+    :param first: number of the first season
+    :param seasons: number of seasons
+    :param seed: master seed
+    :param fast_outcomes: see League.fast_outcomes
+    :param antithetic: see MonteCarlo
+    :return: seasons, counts, stats
+    """
+    import shutil
+    import tempfile
+    LOGGER.setLevel(logging.WARNING)
+    # databases of each worker in their own directory
+    db_dir = tempfile.mkdtemp()
+    try:
+        league = load_league(league_file, db_dir)
+        _ignore_signals()
+        league.fast_outcomes = fast_outcomes
+        if engine == "batch":
+            league.engine = BatchEngine()
+        monte_carlo = MonteCarlo(league, antithetic)
+        monte_carlo.run(seasons, seed, first)
+        league.destroy(discard=True)
+    finally:
+        shutil.rmtree(db_dir)
+    return monte_carlo.seasons, monte_carlo.counts, monte_carlo.stats
+
+
+def _conference_worker(league_file, conf_name, engine, playoffs, seed, fast_outcomes=False,
+                       luck_seed=None, antithetic=False, strength=None):
+    """ Play the regular season and the playoffs of a conference in a worker process
+    of League.play_conferences
+
+    :param league_file: yaml file with the league
+    :param conf_name: conference name
+    :param engine: one of ENGINES
+    :param playoffs: whether the league has playoffs
+    :param seed: league seed
+    :param fast_outcomes: see League.fast_outcomes
+    :param luck_seed: see League.seed
+    :param antithetic: see League.seed
+    :param strength: strengths of the teams of the parent by team id, the ones of the
+                     file if None
+    :return: Conference.results(), {distribution name: (samples, {score: hits})}
     """
+    import shutil
+    import tempfile
+    LOGGER.setLevel(logging.WARNING)
+    # databases of each worker in their own directory
+    db_dir = tempfile.mkdtemp()
+    try:
+        league = load_league(league_file, db_dir)
+        _ignore_signals()
+        league.playoffs = playoffs
+        league.fast_outcomes = fast_outcomes
+        # hits are sent back to the parent, not written here
+        league.flush_on = "exit"
+        if engine == "batch":
+            league.engine = BatchEngine()
+        if strength is not None:
+            if len(strength) != len(league.store):
+                raise RuntimeError("Error: league {0} does not have the teams of "
+                                   "{1}".format(league.name, league_file))
+            league.store.strength[:] = array.array('d', strength)
+        if seed is not None:
+            league.seed(seed, luck_seed, antithetic)
+        league.initialize()
+        conf = league.conferences[conf_name]
+        while not conf.regular_season():
+            pass
+        if playoffs:
+            conf.build_playoffs()
+            conf.build_playouts()
+            completed = False
+            while not completed:
+                conf.setup_postseason()
+                completed = conf.postseason()
+        hits = {distr_name: (distr.samples, dict(distr.pending_hits))
+                for distr_name, distr in league.distributions.items()}
+        results = conf.results()
+        league.destroy(discard=True)
+    finally:
+        shutil.rmtree(db_dir)
+    return results, hits
 
-    def __init__(self):
-        """
 
-        """
-        self.home = 0
-        self.away = 0
-        self.score = "0-0"
+class BatchEngine(object):
+    """
+    Plays all matches of a day at once with vectorized draws, same model as Match.play
+    """
 
-    @staticmethod
-    def generate(name):
+    def __init__(self, seed=None, luck_seed=None, antithetic=False):
         """
 
-        :param name: DB name
-        :return:
+        :param seed: numpy random generator seed
+        :param luck_seed: seed of the luck draws, see League.seed
+        :param antithetic: use 1 - u for every luck uniform u
         """
-        db_name = name + ".db"
-        db_obj = DistributionDB(db_name)
-        roll = random.uniform(0, 1.0)
-        score = db_obj.get_score(roll)
-        # hit = db_obj.get_hit(score) + 1
-        # LOGGER.debug(msg="Number of hits for score %s: %s" % (score, hit))
-        # db_obj.update(score, hit)
-        # db_obj.close()
-        return score
+        if _numpy() is None:
+            raise RuntimeError("Error: numpy is required by the batch engine")
+        self.tables = {}
+        self.seed(seed, luck_seed, antithetic)
 
-    @staticmethod
-    def get_winner(score):
-        """
+    def __getstate__(self):
+        """ Snapshot of the generators, tables are built again when needed
 
-        :param score:
         :return:
         """
-        res_obj = re.search(r'(\d)-(\d)', score)
-        if int(res_obj.group(1)) > int(res_obj.group(2)):
-            res = "home"
-        elif int(res_obj.group(2)) > int(res_obj.group(1)):
-            res = "away"
-        else:
-            res = "draw"
-        return res
+        return {"rng": self.rng, "luck": self.luck, "antithetic": self.antithetic,
+                "timeline_rng": self.timeline_rng, "tables": {}}
 
-    def update(self, name, score):
+    def seed(self, seed, luck_seed=None, antithetic=False):
         """
 
-        :param name: DB name
-        :param score:
+        :param seed: numpy random generator seed
+        :param luck_seed: seed of the luck draws, derived from seed if None
+        :param antithetic: use 1 - u for every luck uniform u
         :return:
         """
-        db_name = name + ".db"
-        db_obj = DistributionDB(db_name)
-        hit = db_obj.get_hit(score) + 1
-        LOGGER.debug(msg="Number of hits for score %s: %s" % (score, hit))
-        db_obj.update(score, hit)
-        db_obj.close()
-        res_obj = re.search(r'(\d)-(\d)', score)
-        self.home += int(res_obj.group(1))
-        self.away += int(res_obj.group(2))
+        numpy = _numpy()
+        self.rng = numpy.random.default_rng(seed)
+        if luck_seed is None and seed is not None:
+            luck_seed = [seed, 1]
+        self.luck = numpy.random.default_rng(luck_seed)
+        self.antithetic = antithetic
+        self.timeline_rng = numpy.random.default_rng(None if seed is None else [seed, 2])
+
+    def _luck(self, count):
+        """
 
-    def display(self, home_team, away_team):
+        :param count: number of draws
+        :return: luck uniforms
         """
+        roll = self.luck.uniform(0, 1.0, count)
+        if self.antithetic:
+            return 1.0 - roll
+        return roll
 
-        :param home_team:
-        :param away_team:
+    def _table(self, db_obj, result):
+        """ numpy copy of the distribution conditioned on result
+
+        :param db_obj: DistributionDB
+        :param result: "home", "away" or "draw"
+        :return: home goals, away goals, cumulative
+        """
+        numpy = _numpy()
+        key = (db_obj, result)
+        if key not in self.tables:
+            scores, cumulative = db_obj.outcomes[result]
+            home, away = numpy.array(scores, dtype=numpy.int64).reshape(-1, 2).T
+            self.tables[key] = (home, away, numpy.array(cumulative))
+        return self.tables[key]
+
+    def play(self, matches, minutes, distributions, outcomes=None):
+        """ Draw luck factors and scores for all matches, then record them in each match
+
+        :param matches: list of Match
+        :param minutes: 90 or 30 for extra time
+        :param distributions: DistributionRegistry of the league
+        :param outcomes: OutcomeMatrix to draw results with a single uniform, if any
         :return:
         """
-        LOGGER.info(msg="{0} {1}: {2} {3}".format(home_team, self.home, away_team, self.away))
-
-    @staticmethod
-    def simulate_scoring(score, minutes, offset, home_team, away_team):
+        numpy = _numpy()
+        count = len(matches)
+        if not count:
+            return
+        if minutes == 30:
+            name = "extra_time"
+        else:
+            name = "regular_time"
+        db_obj = distributions[name]
+        if outcomes is not None:
+            results = self._results(matches, outcomes)
+        else:
+            strength1 = numpy.fromiter((match.home_team.strength for match in matches),
+                                       dtype=float, count=count)
+            strength2 = numpy.fromiter((match.away_team.strength for match in matches),
+                                       dtype=float, count=count)
+            advantage = numpy.fromiter((match.home_advantage for match in matches),
+                                       dtype=bool, count=count)
+            strength1 = numpy.where(advantage, strength1 * 2, strength1)
+            # Luck factor, the relative strength ratio is the ratio of adjusted strengths
+            strength1 = self._luck(count) * strength1
+            strength2 = self._luck(count) * strength2
+            results = {"home": strength1 > strength2 * 2,
+                       "away": strength1 * 2 < strength2}
+        results["draw"] = ~(results["home"] | results["away"])
+        home = numpy.empty(count, dtype=numpy.int64)
+        away = numpy.empty(count, dtype=numpy.int64)
+        for result, mask in results.items():
+            selected = numpy.flatnonzero(mask)
+            if not len(selected):
+                continue
+            table_home, table_away, cumulative = self._table(db_obj, result)
+            idx = numpy.searchsorted(cumulative, self.rng.uniform(0, 1.0, len(selected)),
+                                     side='right')
+            # rounding may leave the last cumulative value slightly below 1
+            idx = numpy.minimum(idx, len(cumulative) - 1)
+            home[selected] = table_home[idx]
+            away[selected] = table_away[idx]
+        db_obj.samples += count
+        for match, score in zip(matches, zip(home.tolist(), away.tolist())):
+            match.record_score(score, minutes)
+        if matches[0].events.goal_scored:
+            self.timelines(matches)
+        for match in matches:
+            match.emit_played(minutes)
+
+    def timelines(self, matches):
+        """ Draw the goal minutes of the periods not timed yet of all matches at once,
+        see Match.timeline
+
+        :param matches: list of Match
+        :return:
+        """
+        numpy = _numpy()
+        rows = [(pos,) + period for pos, match in enumerate(matches)
+                for period in match.score.periods[match.timed_periods:]]
+        for match in matches:
+            match.timed_periods = len(match.score.periods)
+        if not rows:
+            return
+        pos, offset, minutes, home, away = numpy.array(rows, dtype=numpy.int64).T
+        goals = numpy.concatenate((home, away))
+        owner = numpy.repeat(numpy.concatenate((pos, pos)), goals)
+        side = numpy.repeat(numpy.repeat([0, 1], len(rows)), goals)
+        low = numpy.repeat(numpy.concatenate((offset, offset)) + 1, goals)
+        high = numpy.repeat(numpy.concatenate((offset + minutes, offset + minutes)), goals)
+        minute = self.timeline_rng.integers(low, high + 1)
+        # periods of a match do not overlap, sorting by minute keeps them in order
+        for idx in numpy.lexsort((side, minute, owner)):
+            matches[owner[idx]].goals.append((int(minute[idx]), int(side[idx])))
+
+    def _results(self, matches, outcomes):
+        """ Results of all matches from a single uniform each, see Match.play
+
+        :param matches: list of Match
+        :param outcomes: OutcomeMatrix
+        :return: {"home": mask, "away": mask}
         """
+        numpy = _numpy()
+        count = len(matches)
+        home = numpy.empty(count)
+        away = numpy.empty(count)
+        for pos, match in enumerate(matches):
+            if match.home_advantage:
+                home[pos], away[pos] = outcomes.pair(match.home_team.id, match.away_team.id)
+            else:
+                home[pos], _, away[pos] = outcomes.probabilities(match.home_team,
+                                                                 match.away_team, False)
+        roll = self._luck(count)
+        return {"home": roll < home, "away": roll >= 1 - away}
 
-        :param score:
-        :param minutes:
-        :param home_team:
-        :param away_team:
-        :param offset:
+    def penalty_kicks(self, matches):
+        """ Shootouts of all matches at once, same model as penalty_shootout
+
+        :param matches: list of tied Match
         :return:
         """
+        numpy = _numpy()
+        count = len(matches)
+        if not count:
+            return
+        # home kicks in even columns, away kicks in odd ones
+        kicks = self.rng.integers(0, 2, (count, 10))
+        home = numpy.cumsum(kicks[:, 0::2], axis=1)
+        away = numpy.cumsum(kicks[:, 1::2], axis=1)
+        # kicks scored and kicks left after each of the 10 kicks
+        home_after = numpy.repeat(home, 2, axis=1)
+        away_after = numpy.repeat(away, 2, axis=1)
+        away_after = numpy.hstack((numpy.zeros((count, 1), dtype=away.dtype), away_after[:, :-1]))
+        kick = numpy.arange(10)
+        home_left = 4 - kick // 2
+        away_left = 5 - (kick + 1) // 2
+        decided = (home_after > away_after + away_left) | (away_after > home_after + home_left)
+        last = decided.argmax(axis=1)
+        rows = numpy.arange(count)
+        home_total = home_after[rows, last]
+        away_total = away_after[rows, last]
+        tied = numpy.flatnonzero(~decided.any(axis=1))
+        if len(tied):
+            home_total[tied] = home[tied, 4]
+            away_total[tied] = away[tied, 4]
+            rounds = self.rng.geometric(0.5, len(tied))
+            both = self.rng.binomial(rounds - 1, 0.5)
+            home_wins = self.rng.integers(0, 2, len(tied))
+            home_total[tied] += both + home_wins
+            away_total[tied] += both + 1 - home_wins
+        for match, home_kicks, away_kicks in zip(matches, home_total.tolist(),
+                                                 away_total.tolist()):
+            match.set_penalties(home_kicks, away_kicks)
+
+
+def _handle_cli_signals(league):
+    """ Command line only, the library installs no signal handler: on SIGINT or SIGPIPE
+    drop the databases of the league and exit
+
+    :param league: League
+    :return:
+    """
+    def handler(signum, frame):
+        import traceback
+        LOGGER.warning(msg="Interrupt handler called: {0}".format(signum))
+        traceback.print_stack(frame)
+        league.destroy(discard=True)
+        sys.exit(0)
+    signal.signal(signal.SIGPIPE, handler)
+    signal.signal(signal.SIGINT, handler)
 
-        res_obj = re.search(r'(\d)-(\d)', score)
-
-        goal_list = {}
-        score_dict = {"home": int(res_obj.group(1)), "away": int(res_obj.group(2))}
-        t_list = {"home": home_team, "away": away_team}
-        for team in score_dict.keys():
-            if score_dict[team] > 0:
-                for i in range(score_dict[team]):
-                    minute = random.randint(offset, minutes+offset)
-                    if minute in goal_list:
-                        minute = random.randint(offset, minutes+offset)
-                    goal_list[minute] = t_list[team]
-        for goal in sorted(goal_list.keys()):
-            LOGGER.debug(msg="Minute: {0}, Goal!!! {1} scored".format(goal, goal_list[goal]))
 
 if __name__ == '__main__':
 
+    import argparse
+    import shutil
+    import tempfile
+
+    setup_logging()
+
     PARSER = argparse.ArgumentParser(description="standalone parser")
 
     PARSER.add_argument('--league_file', dest='league_file',
                         help='specify league file name',
                         type=str, required=True)
 
+    PARSER.add_argument('--no_league_cache', dest='league_cache',
+                        help='parse the league file, without reading or writing its cache',
+                        action='store_false')
+
+    PARSER.add_argument('--db_dir', dest='db_dir',
+                        help='directory for the database files, current directory by default',
+                        type=str, default=None)
+
+    PARSER.add_argument('--keep_db', dest='keep_db',
+                        help='keep the database files, the next run skips loading them',
+                        action='store_true')
+
+    PARSER.add_argument('--flush', dest='flush_on',
+                        help='when to write score hit counts to the DBs',
+                        choices=FLUSH_BOUNDARIES, default="season")
+
+    PARSER.add_argument('--engine', dest='engine',
+                        help='play matches one by one or a whole day at once (needs numpy)',
+                        choices=ENGINES, default="match")
+
+    PARSER.add_argument('--seasons', dest='seasons',
+                        help='number of seasons, more than one runs a Monte Carlo simulation',
+                        type=int, default=1)
+
+    PARSER.add_argument('--workers', dest='workers',
+                        help='number of processes for a Monte Carlo simulation, '
+                             'or for the conferences of a single season',
+                        type=int, default=1)
+
+    PARSER.add_argument('--seed', dest='seed',
+                        help='master seed, results do not depend on the number of workers',
+                        type=int, default=None)
+
+    PARSER.add_argument('--checkpoint', dest='checkpoint',
+                        help='snapshot file written periodically and on SIGINT/SIGTERM, '
+                             'the run resumes from it if it exists',
+                        type=str, default=None)
+
+    PARSER.add_argument('--checkpoint_interval', dest='checkpoint_interval',
+                        help='seconds between snapshots',
+                        type=float, default=300)
+
+    PARSER.add_argument('--matches', dest='matches',
+                        help='file the matches are written to as they are played',
+                        type=str, default=None)
+
+    PARSER.add_argument('--matches_format', dest='matches_format',
+                        help='format of the matches file',
+                        choices=MATCH_FORMATS, default="jsonl")
+
+    PARSER.add_argument('--fast_outcomes', dest='fast_outcomes',
+                        help='draw match results with one uniform from their exact probabilities',
+                        action='store_true')
+
+    PARSER.add_argument('--expected', dest='expected',
+                        help='show expected regular season standings, without playing',
+                        action='store_true')
+
+    PARSER.add_argument('--antithetic', dest='antithetic',
+                        help='play Monte Carlo seasons in antithetic pairs of luck draws',
+                        action='store_true')
+
+    PARSER.add_argument('--precision', dest='precision',
+                        help='stop the Monte Carlo simulation once the standard errors of '
+                             'the title odds are below it, --seasons is the maximum',
+                        type=float, default=None)
+
+    PARSER.add_argument('--compare', dest='compare',
+                        help='league file with other strengths for the same teams, both '
+                             'leagues play under the same luck draws',
+                        type=str, default=None)
+
+    PARSER.add_argument('--dynasty', dest='dynasty',
+                        help='play --seasons consecutive seasons with promotion, relegation '
+                             'and strengths recomputed from the seasons played',
+                        action='store_true')
+
+    PARSER.add_argument('--window', dest='window',
+                        help='number of seasons the strengths of a dynasty are computed from',
+                        type=int, default=Dynasty.WINDOW)
+
     # do the parsing
     ARGS = PARSER.parse_known_args()[0]
-
-    LEAGUE = load_league(league_file=ARGS.league_file)
+    if ARGS.matches and ARGS.workers > 1:
+        PARSER.error("--matches needs a single worker")
+    if ARGS.compare and (ARGS.workers > 1 or ARGS.checkpoint or ARGS.matches):
+        PARSER.error("--compare needs a single worker, no checkpoint and no matches file")
+    if ARGS.dynasty and (ARGS.workers > 1 or ARGS.checkpoint or ARGS.compare):
+        PARSER.error("--dynasty needs a single worker, no checkpoint and no comparison")
+
+    CHECKPOINT = None
+    LEAGUE = None
+    if ARGS.checkpoint:
+        CHECKPOINT = Checkpoint(ARGS.checkpoint, ARGS.checkpoint_interval)
+        if ARGS.seasons == 1:
+            LEAGUE = CHECKPOINT.load("league")
+    RESUMED = LEAGUE is not None
+    if not RESUMED:
+        LEAGUE = load_league(league_file=ARGS.league_file, db_dir=ARGS.db_dir,
+                             cache=ARGS.league_cache)
+        LEAGUE.flush_on = ARGS.flush_on
+        LEAGUE.fast_outcomes = ARGS.fast_outcomes
+        if ARGS.engine == "batch":
+            LEAGUE.engine = BatchEngine()
+    _handle_cli_signals(LEAGUE)
+    if CHECKPOINT:
+        CHECKPOINT.handle_signals()
+    WRITER = None
+    if ARGS.matches:
+        WRITER = MatchWriter(ARGS.matches, ARGS.matches_format,
+                             append=bool(CHECKPOINT and os.path.exists(CHECKPOINT.path)))
+        WRITER.subscribe(LEAGUE)
     LEAGUE.display()
-    LEAGUE.initialize()
-    LEAGUE.play()
-    LEAGUE.destroy()
+    try:
+        if ARGS.expected:
+            LEAGUE.display_expected_standings()
+        elif ARGS.compare:
+            # DBs of the other league in their own directory
+            OTHER_DIR = tempfile.mkdtemp()
+            try:
+                OTHER = load_league(league_file=ARGS.compare, db_dir=OTHER_DIR,
+                                    cache=ARGS.league_cache)
+                OTHER.fast_outcomes = ARGS.fast_outcomes
+                if ARGS.engine == "batch":
+                    OTHER.engine = BatchEngine()
+                COMPARISON = Comparison(LEAGUE, OTHER, ARGS.antithetic)
+                COMPARISON.run(ARGS.seasons, ARGS.seed, ARGS.precision)
+                COMPARISON.display()
+                OTHER.destroy(discard=True)
+            finally:
+                shutil.rmtree(OTHER_DIR)
+        elif ARGS.dynasty:
+            DYNASTY = Dynasty(LEAGUE, ARGS.window)
+            DYNASTY.run(ARGS.seasons, ARGS.seed)
+            DYNASTY.display()
+        elif ARGS.seasons > 1:
+            MONTE_CARLO = MonteCarlo(LEAGUE, ARGS.antithetic)
+            if CHECKPOINT:
+                SNAPSHOT = CHECKPOINT.load("monte_carlo")
+                if SNAPSHOT is not None:
+                    MONTE_CARLO.restore(SNAPSHOT)
+                MONTE_CARLO.checkpoint = CHECKPOINT
+            if ARGS.workers > 1:
+                MONTE_CARLO.run_parallel(ARGS.league_file, ARGS.seasons, ARGS.workers, ARGS.seed,
+                                         ARGS.precision)
+            else:
+                MONTE_CARLO.run(ARGS.seasons, ARGS.seed, precision=ARGS.precision)
+            MONTE_CARLO.display()
+        else:
+            EventLogger().subscribe(LEAGUE.events)
+            LEAGUE.workers = ARGS.workers
+            LEAGUE.checkpoint = CHECKPOINT
+            if not RESUMED:
+                if ARGS.seed is not None:
+                    LEAGUE.seed(ARGS.seed)
+                LEAGUE.initialize()
+            LEAGUE.play()
+    except Interrupted as INTERRUPTED:
+        # the snapshot is kept, as are the DBs, the run resumes from them
+        if WRITER:
+            WRITER.close()
+        sys.exit(128 + INTERRUPTED.signum)
+    if WRITER:
+        WRITER.close()
+    if CHECKPOINT:
+        CHECKPOINT.remove()
+    if ARGS.keep_db:
+        LEAGUE.close()
+    else:
+        LEAGUE.destroy(discard=True)
@@ -11,6 +11,7 @@ config = {
     'author_email': 'uboscolo@gmail.com',
     'version': '0.1',
     'install_requires': ['nose'],
+    'extras_require': {'batch': ['numpy']},
     'packages': ['ncl'],
     'scripts': [],
     'name': 'ncl'
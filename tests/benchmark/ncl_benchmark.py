@@ -0,0 +1,249 @@
+""" Scalability benchmark of ncl_lib
+
+Plays one season of synthetic leagues from 8 to 4096 teams, timing each phase
+separately, and writes the results as JSON:
+
+    python -m tests.benchmark.ncl_benchmark --output benchmark.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import platform
+import argparse
+import subprocess
+import tempfile
+import shutil
+import concurrent.futures
+import yaml
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from ncl import ncl_lib
+
+# (teams, conferences, divisions per conference), divisions of 4 to 8 teams
+CASES = (
+    (8, 2, 1),
+    (16, 2, 2),
+    (32, 2, 2),
+    (64, 2, 4),
+    (128, 4, 4),
+    (256, 4, 8),
+    (512, 8, 8),
+    (1024, 8, 16),
+    (2048, 16, 16),
+    (4096, 16, 32),
+)
+
+PHASES = ("load", "initialize", "regular_season", "postseason", "final", "destroy")
+
+# score distributions of the synthetic leagues
+DATABASES_FILE = os.path.join(os.path.dirname(__file__), "..", "functest", "ncl_8teams.yaml")
+
+
+def parse_case(value):
+    """
+
+    :param value: teams:conferences:divisions
+    :return: (teams, conferences, divisions per conference)
+    """
+    try:
+        teams, conferences, divisions = [int(item) for item in value.split(":")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected teams:conferences:divisions, "
+                                         "got {0}".format(value))
+    return teams, conferences, divisions
+
+
+def generate_league(league_file, teams, conferences, divisions, seed=0):
+    """ Write a league yaml file with teams split evenly in conferences and divisions
+
+    :param league_file: yaml file to write
+    :param teams: number of teams
+    :param conferences: number of conferences
+    :param divisions: number of divisions per conference
+    :param seed: seed of the team strengths
+    :return:
+    """
+    per_division = teams // (conferences * divisions)
+    if per_division < 2 or per_division % 2 or per_division * conferences * divisions != teams:
+        raise RuntimeError("Error: cannot split {0} teams in {1} conferences of {2} "
+                           "divisions".format(teams, conferences, divisions))
+    with open(DATABASES_FILE, "r") as stream:
+        databases = list(yaml.safe_load(stream).values())[0]["databases"]
+    rng = random.Random(seed)
+    conf_dict = {}
+    team_idx = 0
+    for conf_idx in range(conferences):
+        div_dict = {}
+        for div_idx in range(divisions):
+            team_dict = {}
+            for _ in range(per_division):
+                team_dict["Team {0}".format(team_idx)] = {"strength": rng.randint(1, 100)}
+                team_idx += 1
+            div_dict["Division {0}-{1}".format(conf_idx, div_idx)] = {"teams": team_dict}
+        conf_dict["Conference {0}".format(conf_idx)] = {"divisions": div_dict}
+    league = {"Benchmark {0}".format(teams): {"playoffs": True,
+                                              "databases": databases,
+                                              "conferences": conf_dict}}
+    with open(league_file, "w") as stream:
+        yaml.safe_dump(league, stream, default_flow_style=False)
+
+
+def peak_rss():
+    """
+
+    :return: peak resident set size of this process in KB, None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_case(teams, conferences, divisions, engine="match", seed=0):
+    """ Play a season of a synthetic league, timing each phase
+
+    :param teams: number of teams
+    :param conferences: number of conferences
+    :param divisions: number of divisions per conference
+    :param engine: one of ncl_lib.ENGINES
+    :param seed: seed of the team strengths and of the season
+    :return: {"teams", "conferences", "divisions", "matches", "phases": {phase: seconds},
+              "peak_rss_kb"}
+    """
+    ncl_lib.LOGGER.setLevel(logging.WARNING)
+    work_dir = tempfile.mkdtemp()
+    phases = {}
+    matches = []
+    try:
+        league_file = os.path.join(work_dir, "league.yaml")
+        generate_league(league_file, teams, conferences, divisions, seed)
+
+        start = time.perf_counter()
+        league = ncl_lib.load_league(league_file, work_dir)
+        phases["load"] = time.perf_counter() - start
+
+        if engine == "batch":
+            league.engine = ncl_lib.BatchEngine()
+        league.seed(seed)
+        league.events.subscribe("match_played", lambda match, minutes: matches.append(minutes))
+
+        start = time.perf_counter()
+        league.initialize()
+        phases["initialize"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        league.play_regular_season()
+        phases["regular_season"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        league.play_postseason()
+        phases["postseason"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        league.setup_final()
+        league.play_final()
+        league.flush("season")
+        phases["final"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        league.destroy()
+        phases["destroy"] = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_dir)
+    return {"teams": teams, "conferences": conferences, "divisions": divisions,
+            "matches": len(matches), "phases": phases, "peak_rss_kb": peak_rss()}
+
+
+def import_time(repeat=3):
+    """ Import ncl_lib in fresh interpreters
+
+    :param repeat: number of imports
+    :return: seconds of the fastest import
+    """
+    code = ("import time; start = time.perf_counter(); import ncl.ncl_lib; "
+            "print(time.perf_counter() - start)")
+    root = os.path.join(os.path.dirname(__file__), "..", "..")
+    return min(float(subprocess.run([sys.executable, "-c", code], cwd=root, check=True,
+                                    stdout=subprocess.PIPE,
+                                    universal_newlines=True).stdout)
+               for _ in range(repeat))
+
+
+def run(cases, engine="match", seed=0):
+    """ Run each case in a fresh process, so that peak RSS is the one of the case
+
+    :param cases: list of (teams, conferences, divisions per conference)
+    :param engine: one of ncl_lib.ENGINES
+    :param seed:
+    :return: results, see run_case
+    """
+    results = []
+    for teams, conferences, divisions in cases:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_case, teams, conferences, divisions,
+                                     engine, seed).result()
+        results.append(result)
+        sys.stderr.write("{0:5d} teams {1} peak_rss={2}KB\n".format(
+            teams, " ".join("{0}={1:.3f}s".format(phase, result["phases"][phase])
+                            for phase in PHASES), result["peak_rss_kb"]))
+    return results
+
+
+if __name__ == '__main__':
+
+    PARSER = argparse.ArgumentParser(description="ncl_lib scalability benchmark")
+
+    PARSER.add_argument('--output', dest='output',
+                        help='JSON results file, standard output by default',
+                        type=str, default=None)
+
+    PARSER.add_argument('--case', dest='cases',
+                        help='teams:conferences:divisions, repeat for several cases, '
+                             '8 to 4096 teams by default',
+                        type=parse_case, action='append', default=None)
+
+    PARSER.add_argument('--max_teams', dest='max_teams',
+                        help='skip default cases with more teams',
+                        type=int, default=None)
+
+    PARSER.add_argument('--engine', dest='engine',
+                        help='match engine',
+                        choices=ncl_lib.ENGINES, default="match")
+
+    PARSER.add_argument('--seed', dest='seed',
+                        help='seed of the team strengths and of the seasons',
+                        type=int, default=0)
+
+    ARGS = PARSER.parse_args()
+
+    SELECTED = ARGS.cases or [case for case in CASES
+                              if ARGS.max_teams is None or case[0] <= ARGS.max_teams]
+    IMPORT_SECONDS = import_time()
+    if IMPORT_SECONDS > ncl_lib.IMPORT_BUDGET:
+        sys.stderr.write("import took {0:.3f}s, over the budget of {1}s\n".format(
+            IMPORT_SECONDS, ncl_lib.IMPORT_BUDGET))
+    REPORT = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "engine": ARGS.engine,
+        "seed": ARGS.seed,
+        "import_seconds": IMPORT_SECONDS,
+        "import_budget": ncl_lib.IMPORT_BUDGET,
+        "import_within_budget": IMPORT_SECONDS <= ncl_lib.IMPORT_BUDGET,
+        "results": run(SELECTED, ARGS.engine, ARGS.seed),
+    }
+    if ARGS.output:
+        with open(ARGS.output, "w") as OUTPUT:
+            json.dump(REPORT, OUTPUT, indent=2)
+    else:
+        json.dump(REPORT, sys.stdout, indent=2)
+        sys.stdout.write("\n")
@@ -1,56 +1,46 @@
-from nose.tools import *
+"""
+Functional tests, full seasons of the sample leagues
+"""
 import os
-from ncl.ncl import *
-
-def setup():
-    try:
-        if os.path.exists("regular_season_game.db"):
-            os.remove("regular_season_game.db")
-        if os.path.exists("extra_time.db"):
-            os.remove("extra_time.db")
-        if os.path.exists("/tmp/test8.log"):
-            os.remove("/tmp/test8.log")
-        if os.path.exists("/tmp/test64.log"):
-            os.remove("/tmp/test64.log")
-    except:
-        raise
-
-def teardown():
-    try:
-        if os.path.exists("regular_season_game.db"):
-            os.remove("regular_season_game.db")
-        if os.path.exists("extra_time.db"):
-            os.remove("extra_time.db")
-    except:
-        raise
+import shutil
+import tempfile
+from ncl.ncl_lib import load_league
+from tests.benchmark.ncl_benchmark import run_case, PHASES
+
+DB_DIR = None
+
+
+def setup_module():
+    global DB_DIR
+    DB_DIR = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(DB_DIR)
+
+
+def _play(league_file):
+    league = load_league(os.path.join(os.path.dirname(__file__), league_file), DB_DIR)
+    league.display()
+    league.seed(0)
+    league.initialize()
+    league.play()
+    assert league.champion is not None
+    league.destroy()
 
 
 def test_8():
     """Run Ncl with a 8-team league"""
-    try:
-        Logger("extensive", "/tmp/test8.log")
-        xml_file = open("tests/functest/ncl_8teams.xml", "r")
-        p = Parser(xml_file)
-        league = p.ParseXml()
-        league.Display()
-        league.Initialize()
-        league.Play()
-        league.Destroy()
-    except IOError:
-        print "Could not open file"
-        raise
+    _play("ncl_8teams.yaml")
+
 
 def test_64():
     """Run Ncl with a 64-team league"""
-    try:
-        Logger("extensive", "/tmp/test64.log")
-        xml_file = open("tests/functest/ncl_64teams.xml", "r")
-        p = Parser(xml_file)
-        league = p.ParseXml()
-        league.Display()
-        league.Initialize()
-        league.Play()
-        league.Destroy()
-    except IOError:
-        print "Could not open file"
-        raise
+    _play("ncl_64teams.yaml")
+
+
+def test_benchmark():
+    """Run the benchmark on a small synthetic league"""
+    result = run_case(16, 2, 2)
+    assert sorted(result["phases"]) == sorted(PHASES)
+    assert result["matches"] > 0
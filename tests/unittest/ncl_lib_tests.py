@@ -0,0 +1,941 @@
+"""
+Unit tests for ncl_lib
+"""
+import os
+import csv
+import json
+import random
+import signal
+import logging
+import tempfile
+import shutil
+import subprocess
+import sys
+import yaml
+from ncl.ncl_lib import DistributionDB, League, BatchEngine, MonteCarlo, Team, TeamStore, \
+    Match, Standings, Checkpoint, MatchWriter, MatchRecord, round_robin_template, load_league, \
+    penalty_shootout, outcome_probabilities, OutcomeMatrix, AntitheticRandom, Comparison, \
+    RunningStats, goal_timeline, parse_score, format_score, read_league, LEAGUE_CACHE_SUFFIX, \
+    LOGGER, Dynasty, Interrupted
+
+DB_FILE = "test_distribution.db"
+DB_FILES = [DB_FILE, "test_league_regular_time.db", "test_league_extra_time.db"]
+LEAGUE_FILE = os.path.join(os.path.dirname(__file__), "..", "functest", "ncl_8teams.yaml")
+
+
+def setup_module():
+    for db_file in DB_FILES:
+        if os.path.exists(db_file):
+            os.remove(db_file)
+
+
+def teardown_module():
+    for db_file in DB_FILES:
+        if os.path.exists(db_file):
+            os.remove(db_file)
+
+
+def _distribution():
+    db = DistributionDB(DB_FILE)
+    db.create_table()
+    db.add_score("1-0", 0.5)
+    db.add_score("0-0", 0.3)
+    db.add_score("0-1", 0.2)
+    db.load()
+    return db
+
+
+def _league():
+    league = League("Test League")
+    conf = league.add_conference("Conference")
+    div = conf.add_division("Division")
+    for name, strength in (("A", 4), ("B", 3), ("C", 2), ("D", 1)):
+        div.add_team(name).strength = strength
+    for db_name in ("regular_time", "extra_time"):
+        db = league.create_distribution_db(db_name)
+        for score, prob in (("1-0", 0.5), ("0-0", 0.3), ("0-1", 0.2)):
+            db.add_score(score, prob)
+        db.load()
+    return league
+
+
+def test_sample():
+    """Check in-memory sampling against the cumulative distribution"""
+    db = _distribution()
+    assert db.sample(0.0) == (1, 0)
+    assert db.sample(0.49) == (1, 0)
+    assert db.sample(0.5) == (0, 0)
+    assert db.sample(0.79) == (0, 0)
+    assert db.sample(0.99) == (0, 1)
+    # rounding on the last cumulative value
+    assert db.sample(1.0) == (0, 1)
+    assert db.sample(0.6) == parse_score(db.get_score(0.6))
+    db.destroy()
+
+
+def test_flush():
+    """Check hit counts are kept in memory until flushed"""
+    db = _distribution()
+    db.record((1, 0))
+    db.record((1, 0))
+    db.record((0, 1))
+    assert db.get_hit("1-0") == 2
+    db.cursor.execute("SELECT hit FROM scores WHERE score = '1-0'")
+    assert db.cursor.fetchone()[0] == 0
+    db.flush()
+    assert db.pending_hits == {}
+    assert db.get_hit("1-0") == 2
+    assert db.get_hit("0-1") == 1
+    db.destroy()
+
+
+def _count_writes(db, writes):
+    flush = db.flush
+
+    def counting_flush():
+        if db.pending_hits:
+            writes.append(db.db_name)
+        flush()
+    db.flush = counting_flush
+
+
+def _flushed_season(db_dir, flush_on):
+    league = load_league(LEAGUE_FILE, db_dir)
+    league.flush_on = flush_on
+    writes = []
+    for db in league.distributions.values():
+        _count_writes(db, writes)
+    league.seed(1)
+    league.initialize()
+    league.play()
+    return league, writes
+
+
+EXIT_CHECK = """
+import sys
+from ncl.ncl_lib import load_league
+league = load_league(sys.argv[1], sys.argv[2])
+league.flush_on = "exit"
+league.seed(1)
+league.initialize()
+league.play()
+print(league.distributions["regular_time"].db_name)
+"""
+
+
+def test_flush_policy():
+    """Check the league writes hit counts to the DBs only at the boundaries of its policy,
+    and that pending hits are not lost when it ends"""
+    counts = {}
+    db_dir = tempfile.mkdtemp()
+    try:
+        for flush_on in ("day", "season", "exit"):
+            league, writes = _flushed_season(db_dir, flush_on)
+            counts[flush_on] = len(writes)
+            league.close()
+            counts[flush_on, "close"] = len(writes)
+        for discard in (False, True):
+            league, writes = _flushed_season(db_dir, "exit")
+            league.destroy(discard=discard)
+            counts["exit", "discard" if discard else "destroy"] = len(writes)
+        # a process ending without close() or destroy()
+        root = os.path.join(os.path.dirname(__file__), "..", "..")
+        db_name = subprocess.run([sys.executable, "-c", EXIT_CHECK,
+                                  os.path.abspath(LEAGUE_FILE), db_dir], cwd=root,
+                                 check=True, stdout=subprocess.PIPE,
+                                 universal_newlines=True).stdout.strip()
+        db = DistributionDB(db_name)
+        db.cursor.execute("SELECT SUM(hit) FROM scores")
+        assert db.cursor.fetchone()[0] > 0
+        db.destroy()
+    finally:
+        shutil.rmtree(db_dir)
+    assert counts["day"] > 2
+    # one write per DB with hits
+    assert 1 <= counts["season"] <= 2
+    assert counts["season", "close"] == counts["season"]
+    assert counts["exit"] == 0
+    assert counts["exit", "close"] == counts["season"]
+    assert counts["exit", "destroy"] == counts["season"]
+    assert counts["exit", "discard"] == 0
+
+
+def test_sample_outcome():
+    """Check sampling conditioned on the match outcome"""
+    db = _distribution()
+    assert db.sample(0.99, "home") == (1, 0)
+    assert db.sample(0.0, "draw") == (0, 0)
+    assert db.sample(0.5, "away") == (0, 1)
+    assert db.samples == 3
+    db.destroy()
+
+
+def test_parse_score():
+    """Check scores are parsed once into integer pairs, double digits included"""
+    assert parse_score("2-1") == (2, 1)
+    assert parse_score("10-12") == (10, 12)
+    assert format_score((10, 12)) == "10-12"
+    for score in ("2:1", "a-1", "2-"):
+        try:
+            parse_score(score)
+            assert False
+        except RuntimeError:
+            pass
+    db = DistributionDB(DB_FILE)
+    db.bulk_load({"10-2": 0.5, "2-10": 0.25, "11-11": 0.25})
+    assert db.sample(0.0, "home") == (10, 2)
+    assert db.sample(0.0, "draw") == (11, 11)
+    db.record((2, 10))
+    db.flush()
+    assert db.get_hit("2-10") == 1
+    db.destroy()
+
+
+def test_batch_engine():
+    """Check a regular season played a day at a time"""
+    league = _league()
+    league.engine = BatchEngine(0)
+    matches = []
+    league.events.subscribe("match_played", lambda match, minutes: matches.append(match))
+    league.initialize()
+    div = league.conferences["Conference"].divisions["Division"]
+    while not div.schedule.completed:
+        div.play()
+    assert len(matches) == 12
+    points = 0
+    for match in matches:
+        if match.winner:
+            assert match.loser
+            points += 3
+        else:
+            assert match.score.home == match.score.away
+            points += 2
+    assert sum(team.points for team in div.teams) == points
+    league.destroy()
+
+
+def test_monte_carlo():
+    """Check outcome probabilities over several seasons"""
+    league = _league()
+    league.playoffs = True
+    monte_carlo = MonteCarlo(league)
+    monte_carlo.run(5)
+    assert monte_carlo.seasons == 5
+    probabilities = monte_carlo.probabilities()
+    assert sorted(probabilities) == ["A", "B", "C", "D"]
+    for outcome, total in (("division", 1), ("playoffs", 2), ("conference", 1),
+                           ("league", 1), ("relegation", 1)):
+        assert abs(sum(team[outcome] for team in probabilities.values()) - total) < 1e-9
+    league.destroy()
+
+
+def test_monte_carlo_seed():
+    """Check seeded seasons do not depend on how the run is split"""
+    league = _league()
+    league.playoffs = True
+    whole = MonteCarlo(league)
+    whole.run(4, seed=7)
+    split = MonteCarlo(league)
+    split.run(1, seed=7)
+    split.run(3, seed=7, first=1)
+    assert whole.counts == split.counts
+    league.destroy()
+
+
+def test_events():
+    """Check subscribers get matches, goals, days and the end of the season"""
+    league = _league()
+    played = []
+    goals = []
+    days = []
+    seasons = []
+    league.events.subscribe("match_played", lambda match, minutes: played.append(match))
+    league.events.subscribe("goal_scored", lambda match, minute, team: goals.append(team))
+    league.events.subscribe("day_completed", lambda association, day: days.append(day))
+    league.events.subscribe("season_finished", seasons.append)
+    league.initialize()
+    league.play()
+    assert len(played) == 12
+    assert len(goals) == sum(match.score.home + match.score.away for match in played)
+    assert len(days) == 6
+    assert seasons == [league]
+    league.destroy()
+
+
+def test_registry():
+    """Check leagues with the same name play side by side, each with its own DB files"""
+    db_dir = tempfile.mkdtemp()
+    try:
+        league = load_league(LEAGUE_FILE, db_dir)
+        other = load_league(LEAGUE_FILE, db_dir)
+        paths = [distr.db_name for distr in league.distributions.values()]
+        other_paths = [distr.db_name for distr in other.distributions.values()]
+        assert paths == [os.path.abspath(league.distributions.path(name))
+                         for name in league.distributions.distributions]
+        assert not set(paths) & set(other_paths)
+        for each in (league, other):
+            each.seed(3)
+            each.initialize()
+            each.play()
+            each.flush()
+        assert league.champion.name == other.champion.name
+        for name, distr in league.distributions.items():
+            assert distr.get_hit("1-0") == other.distributions[name].get_hit("1-0")
+        other.destroy()
+        assert not any(os.path.exists(path) for path in other_paths)
+        # the previous league is still referenced while the new one loads
+        league = load_league(LEAGUE_FILE, db_dir)
+        league.destroy()
+    finally:
+        shutil.rmtree(db_dir)
+
+
+def test_registry_release():
+    """Check leagues that failed to load or were dropped do not keep their DB files"""
+    db_dir = tempfile.mkdtemp()
+    try:
+        with open(LEAGUE_FILE, "r") as stream:
+            league_dict = yaml.safe_load(stream)
+        databases = list(league_dict.values())[0]["databases"]
+        # the second DB does not load, the first one did
+        probabilities = list(databases.values())[-1]["probabilities"]
+        probabilities[list(probabilities)[0]] += 0.5
+        bad_file = os.path.join(db_dir, "bad.yaml")
+        with open(bad_file, "w") as stream:
+            yaml.safe_dump(league_dict, stream)
+        try:
+            load_league(bad_file, db_dir, cache=False)
+            assert False
+        except RuntimeError as err:
+            assert "add up" in str(err)
+        league = load_league(LEAGUE_FILE, db_dir)
+        # dropped without destroy()
+        del league
+        league = load_league(LEAGUE_FILE, db_dir)
+        league.destroy()
+    finally:
+        shutil.rmtree(db_dir)
+
+
+def test_bulk_load():
+    """Check bulk loading, and that an unchanged DB is not reloaded"""
+    probabilities = {"1-0": 0.5, "0-0": 0.3, "0-1": 0.2}
+    db = DistributionDB(DB_FILE)
+    assert db.bulk_load(probabilities)
+    db.record((1, 0))
+    db.close()
+    db = DistributionDB(DB_FILE)
+    assert db.get_hit("1-0") == 1
+    assert not db.bulk_load(probabilities)
+    assert db.get_hit("1-0") == 0
+    assert db.sample(0.6) == (0, 0)
+    assert db.bulk_load({"1-0": 0.6, "0-0": 0.2, "0-1": 0.2})
+    assert db.sample(0.6) == (0, 0)
+    try:
+        db.bulk_load({"1-0": 0.6})
+        assert False
+    except RuntimeError:
+        pass
+    db.destroy()
+
+
+def test_team_store():
+    """Check teams are views on the league's arrays"""
+    store = TeamStore()
+    team1 = Team("A", store)
+    team2 = Team("B", store)
+    assert (team1.id, team2.id) == (0, 1)
+    assert not hasattr(team1, "__dict__")
+    team1.strength = 2.5
+    team1.points += 3
+    team2.series_wins = 1
+    assert list(store.points) == [3, 0]
+    assert store.strength[0] == 2.5
+    store.reset()
+    assert team1.points == 0
+    assert team2.series_wins == 0
+    assert team1.strength == 2.5
+    assert team2.name == "B"
+
+
+def _result(standings, home, away, home_goals, away_goals):
+    match = Match(home, away)
+    match.score.home = home_goals
+    match.score.away = away_goals
+    match.update(standings)
+
+
+def test_standings():
+    """Check tiebreakers: points, goal difference, goals scored, head-to-head"""
+    store = TeamStore()
+    teams = [Team(name, store) for name in ("A", "B", "C", "D")]
+    team_a, team_b, team_c, team_d = teams
+    standings = Standings(teams)
+    assert standings.table() == teams
+    _result(standings, team_b, team_a, 1, 0)
+    _result(standings, team_c, team_d, 3, 0)
+    assert standings.table() == [team_c, team_b, team_a, team_d]
+    _result(standings, team_a, team_b, 1, 0)
+    _result(standings, team_d, team_c, 3, 0)
+    # all level on points and goal difference, C and D scored more
+    assert standings.table() == [team_c, team_d, team_a, team_b]
+    assert Standings.rank([team_b, team_d]) == [team_d, team_b]
+    # X and Y level on points, goal difference and goals scored, Y won head-to-head
+    team_x, team_y, team_z, team_w = [Team(name, store) for name in ("X", "Y", "Z", "W")]
+    standings = Standings([team_x, team_y, team_z, team_w])
+    _result(standings, team_y, team_x, 1, 0)
+    _result(standings, team_x, team_z, 1, 0)
+    _result(standings, team_y, team_w, 0, 1)
+    assert standings.table() == [team_w, team_y, team_x, team_z]
+
+
+def test_round_robin_template():
+    """Check every team meets every other one at home and away, once a day"""
+    template = round_robin_template(6)
+    assert round_robin_template(6) is template
+    assert len(template) == 10
+    for pairs in template:
+        assert sorted(idx for pair in pairs for idx in pair) == list(range(6))
+    fixtures = [pair for pairs in template for pair in pairs]
+    assert sorted(fixtures) == sorted((home, away) for home in range(6)
+                                      for away in range(6) if home != away)
+
+
+def test_lazy_schedule():
+    """Check days are generated as the schedule is played"""
+    league = _league()
+    league.initialize()
+    div = league.conferences["Conference"].divisions["Division"]
+    assert div.schedule.length == 6
+    first_day = div.schedule.current_day
+    assert first_day.matches == []
+    assert len(first_day.fixtures()) == 2
+    div.play()
+    assert len(first_day.matches) == 2
+    assert div.schedule.current_day.number == 2
+    assert div.schedule.current_day.matches == []
+    league.destroy()
+
+
+def _season(db_dir, workers, luck_seed=None, antithetic=False):
+    league = load_league(LEAGUE_FILE, db_dir)
+    league.workers = workers
+    league.seed(11, luck_seed, antithetic)
+    if luck_seed is not None:
+        # strengths changed in memory, not in the file
+        league.store.strength[0] *= 5
+        league.store.strength[-1] /= 5
+    league.initialize()
+    league.play()
+    results = {name: conf.results() for name, conf in league.conferences.items()}
+    hits = {name: (distr.samples, distr.pending_hits, distr.get_hit("1-0"))
+            for name, distr in league.distributions.items()}
+    champion = league.champion.name
+    league.destroy()
+    return results, hits, champion
+
+
+def test_parallel_conferences():
+    """Check conferences played in workers give the same season as played in turn"""
+    db_dir = tempfile.mkdtemp()
+    try:
+        assert _season(db_dir, 2) == _season(db_dir, 1)
+        assert _season(db_dir, 2, 99, True) == _season(db_dir, 1, 99, True)
+        assert _season(db_dir, 1, 99, True) != _season(db_dir, 1)
+    finally:
+        shutil.rmtree(db_dir)
+
+
+def _interrupt(checkpoint, days):
+    """Event callback interrupting the run after some days or seasons"""
+    played = []
+
+    def completed(*args):
+        played.append(args)
+        if len(played) == days:
+            checkpoint.interrupted = signal.SIGTERM
+    return completed
+
+
+def _outcome(league):
+    results = {name: conf.results() for name, conf in league.conferences.items()}
+    hits = {name: (distr.samples, distr.get_hit("1-0"), distr.get_hit("0-0"))
+            for name, distr in league.distributions.items()}
+    return results, hits, league.champion.name
+
+
+def test_checkpoint():
+    """Check a league resumed mid-season, in the regular season or in the playoffs,
+    ends like an uninterrupted one"""
+    db_dir = tempfile.mkdtemp()
+    path = os.path.join(db_dir, "league.snapshot")
+    try:
+        for fast_outcomes in (False, True):
+            league = load_league(LEAGUE_FILE, db_dir)
+            league.fast_outcomes = fast_outcomes
+            league.seed(5)
+            league.initialize()
+            league.play()
+            outcome = _outcome(league)
+            league.destroy()
+            # 4 divisions play 2 days, then conferences play 3 days of playoffs
+            for days in (3, 10):
+                league = load_league(LEAGUE_FILE, db_dir)
+                league.fast_outcomes = fast_outcomes
+                league.seed(5)
+                league.checkpoint = Checkpoint(path)
+                league.events.subscribe("day_completed", _interrupt(league.checkpoint, days))
+                league.initialize()
+                try:
+                    league.play()
+                    assert False
+                except Interrupted as err:
+                    assert err.signum == signal.SIGTERM
+                # the snapshot leaves out the outcome matrix, it is rebuilt
+                assert league.__getstate__()["outcomes"] is None
+                assert all(assoc.schedule.__getstate__()["outcomes"] is None
+                           for assoc in league.associations())
+                league.destroy()
+                league = Checkpoint(path).load("league")
+                assert (league.outcomes is not None) == fast_outcomes
+                assert all(assoc.schedule.outcomes is league.outcomes
+                           for assoc in league.associations())
+                league.play()
+                assert _outcome(league) == outcome
+                league.destroy()
+    finally:
+        shutil.rmtree(db_dir)
+
+
+def test_checkpoint_monte_carlo():
+    """Check a Monte Carlo run resumed from a snapshot counts like an uninterrupted one"""
+    league = _league()
+    league.playoffs = True
+    whole = MonteCarlo(league)
+    whole.run(5, seed=3)
+    db_dir = tempfile.mkdtemp()
+    checkpoint = Checkpoint(os.path.join(db_dir, "monte_carlo.snapshot"))
+    try:
+        interrupted = MonteCarlo(league)
+        interrupted.checkpoint = checkpoint
+        league.events.subscribe("season_finished", _interrupt(checkpoint, 2))
+        try:
+            interrupted.run(5, seed=3)
+            assert False
+        except Interrupted:
+            pass
+        resumed = MonteCarlo(league)
+        resumed.restore(checkpoint.load("monte_carlo"))
+        assert resumed.seasons == 2
+        resumed.run(5, seed=3)
+        assert resumed.counts == whole.counts
+        assert resumed.seasons == 5
+    finally:
+        shutil.rmtree(db_dir)
+    league.destroy()
+
+
+def test_matches():
+    """Check the iterator over played matches"""
+    league = load_league(LEAGUE_FILE, tempfile.mkdtemp())
+    league.seed(1)
+    league.initialize()
+    records = list(league.matches())
+    phases = [record.phase for record in records]
+    # 4 divisions of 2 teams
+    assert phases[0:8] == ["regular_season"] * 8
+    assert set(phases[8:-1]) == {"playoffs", "playouts"}
+    assert phases[-1] == "final"
+    assert [record.day for record in records[0:8]] == [1, 1, 1, 1, 2, 2, 2, 2]
+    for record in records:
+        assert record.season == 0
+        if record.home_penalties is not None:
+            assert record.extra_time
+            assert record.home_goals == record.away_goals
+            assert record.home_penalties != record.away_penalties
+    final = records[-1]
+    winner = final.home if (final.home_goals, final.home_penalties or 0) > \
+        (final.away_goals, final.away_penalties or 0) else final.away
+    assert winner == league.champion.name
+    db_dir = os.path.dirname(league.distributions["regular_time"].db_name)
+    league.destroy()
+    shutil.rmtree(db_dir)
+
+
+def test_match_writer():
+    """Check matches written as JSON Lines and CSV"""
+    db_dir = tempfile.mkdtemp()
+    record = MatchRecord(3, "playoffs", 2, "A", "B", 1, 1, True, 4, 3)
+    try:
+        for fmt in ("jsonl", "csv"):
+            path = os.path.join(db_dir, "matches." + fmt)
+            writer = MatchWriter(path, fmt)
+            writer.write(record)
+            writer.close()
+            writer = MatchWriter(path, fmt, append=True)
+            writer.write(record._replace(season=4, home_penalties=None, away_penalties=None))
+            writer.close()
+            with open(path) as stream:
+                if fmt == "jsonl":
+                    rows = [json.loads(line) for line in stream]
+                else:
+                    rows = list(csv.DictReader(stream))
+            assert len(rows) == 2
+            assert rows[0]["home"] == "A"
+            assert str(rows[0]["home_penalties"]) == "4"
+            assert str(rows[1]["season"]) == "4"
+            assert rows[1]["away_penalties"] in (None, "")
+        league = _league()
+        league.playoffs = True
+        writer = MatchWriter(os.path.join(db_dir, "season.jsonl"))
+        writer.subscribe(league)
+        league.initialize()
+        league.play()
+        writer.close()
+        with open(os.path.join(db_dir, "season.jsonl")) as stream:
+            rows = [json.loads(line) for line in stream]
+        assert [row["phase"] for row in rows].count("regular_season") == 12
+        league.destroy()
+    finally:
+        shutil.rmtree(db_dir)
+
+
+class _Kicks(object):
+    """Random number generator scoring the kicks set in bits, then sudden death rounds"""
+
+    def __init__(self, bits, rounds_roll=0.0, home_wins=1):
+        self.bits = bits
+        self.rounds_roll = rounds_roll
+        self.home_wins = home_wins
+
+    def getrandbits(self, count):
+        if count == 10:
+            return self.bits
+        if count == 1:
+            return self.home_wins
+        return (1 << count) - 1
+
+    def random(self):
+        return self.rounds_roll
+
+
+def test_penalty_shootout():
+    """Check kick tallies, stopping as soon as a team cannot be caught"""
+    # home scores its first 3 kicks, away misses its first 3
+    assert penalty_shootout(_Kicks(0b0000010101)) == (3, 0)
+    # away scores all, home misses all: over after 3 away kicks
+    assert penalty_shootout(_Kicks(0b1010101010)) == (0, 3)
+    # 5 each, decided in the first sudden death round
+    assert penalty_shootout(_Kicks(0b1111111111)) == (6, 5)
+    assert penalty_shootout(_Kicks(0b1111111111, home_wins=0)) == (5, 6)
+    # third sudden death round, both scored in the first two
+    assert penalty_shootout(_Kicks(0, rounds_roll=0.8, home_wins=0)) == (2, 3)
+
+
+def test_batch_penalty_kicks():
+    """Check batch shootouts against the per-match ones"""
+    store = TeamStore()
+    home, away = Team("A", store), Team("B", store)
+    matches = [Match(home, away) for _ in range(4000)]
+    BatchEngine(0).penalty_kicks(matches)
+    rng = random.Random(0)
+    shootouts = [penalty_shootout(rng) for _ in range(4000)]
+    for tallies in [match.penalties for match in matches], shootouts:
+        assert all(kicks_home != kicks_away for kicks_home, kicks_away in tallies)
+        home_wins = sum(kicks_home > kicks_away for kicks_home, kicks_away in tallies)
+        assert 0.45 < home_wins / 4000.0 < 0.55
+    for match in matches:
+        assert (match.winner is home) == (match.penalties[0] > match.penalties[1])
+    mean_batch = sum(sum(match.penalties) for match in matches) / 4000.0
+    mean_single = sum(sum(tallies) for tallies in shootouts) / 4000.0
+    assert abs(mean_batch - mean_single) < 0.2
+
+
+def test_outcome_probabilities():
+    """Check exact result probabilities against the luck factors of Match.play"""
+    rng = random.Random(2)
+    for home_strength, away_strength, home_advantage in ((77, 20, True), (10, 10, True),
+                                                          (5, 40, True), (30, 20, False)):
+        strength1 = home_strength * 2 if home_advantage else home_strength
+        counts = {"home": 0, "draw": 0, "away": 0}
+        for _ in range(100000):
+            ratio = rng.uniform(0, strength1) / rng.uniform(0, away_strength)
+            counts["home" if ratio > 2 else "away" if ratio < 0.5 else "draw"] += 1
+        exact = outcome_probabilities(home_strength, away_strength, home_advantage)
+        for prob, result in zip(exact, ("home", "draw", "away")):
+            assert abs(counts[result] / 100000.0 - prob) < 0.005
+    store = TeamStore()
+    teams = [Team(name, store) for name in "ABC"]
+    for team, strength in zip(teams, (0, 3, 50)):
+        team.strength = strength
+    matrix = OutcomeMatrix(store)
+    for home_team in teams:
+        for away_team in teams:
+            expected = outcome_probabilities(home_team.strength, away_team.strength)
+            for prob, exact in zip(matrix.probabilities(home_team, away_team), expected):
+                assert abs(prob - exact) < 1e-12
+    assert matrix.is_current(store)
+    teams[0].strength = 1
+    assert not matrix.is_current(store)
+
+
+def test_expected_standings():
+    """Check expected points and the single draw fast path"""
+    league = _league()
+    table = league.expected_standings()["Division"]
+    assert [name for name, _ in table] == ["A", "B", "C", "D"]
+    # 12 matches, 3 points for a win, 2 in all for a draw
+    teams = league.conferences["Conference"].divisions["Division"].roster
+    draws = sum(outcome_probabilities(home.strength, away.strength)[1]
+                for home in teams for away in teams if home is not away)
+    assert abs(sum(points for _, points in table) - (36 - draws)) < 1e-9
+    league.fast_outcomes = True
+    for engine in (None, BatchEngine(1)):
+        league.reset()
+        league.engine = engine
+        matches = []
+        league.events.subscribe("match_played", lambda match, minutes: matches.append(match))
+        league.initialize()
+        league.play()
+        assert len(matches) == 12
+        assert all(match.strengths is None for match in matches)
+        league.events.match_played = []
+    league.destroy()
+
+
+def test_antithetic():
+    """Check both seasons of a pair share their luck draws, mirrored in the second one"""
+    rng = random.Random(3)
+    antithetic = AntitheticRandom(3)
+    for _ in range(5):
+        assert abs(antithetic.uniform(0, 4) - (4 - rng.uniform(0, 4))) < 1e-12
+    league = _league()
+    monte_carlo = MonteCarlo(league, antithetic=True)
+    monte_carlo.play_season(0, 2)
+    luck_seed = league.luck_seed
+    assert not league.antithetic
+    assert monte_carlo.stats.blocks == 0
+    monte_carlo.play_season(1, 2)
+    assert league.luck_seed == luck_seed
+    assert league.antithetic
+    assert monte_carlo.stats.blocks == 1
+    monte_carlo.play_season(2, 2)
+    assert league.luck_seed != luck_seed
+    league.destroy()
+
+
+def test_precision():
+    """Check running standard errors and the automatic stop"""
+    league = _league()
+    league.playoffs = True
+    monte_carlo = MonteCarlo(league)
+    monte_carlo.run(10000, seed=1, precision=0.05)
+    seasons = monte_carlo.seasons
+    assert RunningStats.MIN_BLOCKS <= seasons < 10000
+    assert monte_carlo.stats.max_error(MonteCarlo.OUTCOMES.index("league")) <= 0.05
+    # one season per block, the standard error of a proportion
+    errors = monte_carlo.stats.standard_errors()
+    for name, probabilities in monte_carlo.probabilities().items():
+        prob = probabilities["league"]
+        expected = (prob * (1 - prob) / (seasons - 1)) ** 0.5
+        assert abs(errors[name][MonteCarlo.OUTCOMES.index("league")] - expected) < 1e-9
+    league.destroy()
+
+
+def _precision_parallel(db_dir, workers):
+    league = load_league(LEAGUE_FILE, db_dir)
+    monte_carlo = MonteCarlo(league, antithetic=True)
+    # a precision check every 10 seasons, pairs end on even seasons
+    monte_carlo.PRECISION_SEASONS = 9
+    monte_carlo.run_parallel(LEAGUE_FILE, 400, workers, seed=2, precision=0.07)
+    league.destroy()
+    return monte_carlo.seasons, monte_carlo.counts, monte_carlo.stats.means()
+
+
+def test_precision_parallel():
+    """Check a run in workers stops after the same seasons whatever the number of workers"""
+    db_dir = tempfile.mkdtemp()
+    try:
+        seasons, counts, means = _precision_parallel(db_dir, 1)
+        assert RunningStats.MIN_BLOCKS * 2 <= seasons < 400
+        assert seasons % 10 == 0
+        assert _precision_parallel(db_dir, 3) == (seasons, counts, means)
+    finally:
+        shutil.rmtree(db_dir)
+
+
+def test_common_random_numbers():
+    """Check two leagues play under the same luck draws"""
+    db_dirs = [tempfile.mkdtemp() for _ in range(3)]
+    try:
+        league, same, other = [load_league(LEAGUE_FILE, db_dir) for db_dir in db_dirs]
+        comparison = Comparison(league, same)
+        comparison.run(10, seed=4)
+        assert comparison.seasons == 10
+        assert comparison.runs[0].counts == comparison.runs[1].counts
+        assert all(value == 0 for values in comparison.stats.means().values()
+                   for value in values)
+        other.store.strength[0] *= 3
+        comparison = Comparison(league, other)
+        comparison.run(10, seed=4)
+        league_idx = MonteCarlo.OUTCOMES.index("league")
+        differences = comparison.stats.means()
+        assert abs(sum(values[league_idx] for values in differences.values())) < 1e-9
+        assert comparison.runs[0].counts != comparison.runs[1].counts
+        for monte_carlo in comparison.runs:
+            monte_carlo.league.destroy()
+        same.destroy()
+    finally:
+        for db_dir in db_dirs:
+            shutil.rmtree(db_dir)
+
+
+def _rosters(league):
+    return {conf_name: sorted(team.name for div in conf.divisions.values()
+                              for team in div.roster)
+            for conf_name, conf in league.conferences.items()}
+
+
+def test_dynasty():
+    """Check consecutive seasons promote, relegate and recompute strengths in memory"""
+    db_dirs = [tempfile.mkdtemp() for _ in range(2)]
+    try:
+        league, same = [load_league(LEAGUE_FILE, db_dir) for db_dir in db_dirs]
+        modified = os.path.getmtime(LEAGUE_FILE)
+        dynasty = Dynasty(league, window=3)
+        assert dynasty.points() == [16, 16, 8, 8, 4, 4, 4, 4]
+        before = _rosters(league)
+        upper, lower = list(league.conferences)
+        dynasty.run(1, seed=5)
+        relegated = league.conferences[upper].relegated[0].name
+        assert relegated in before[upper]
+        assert relegated in _rosters(league)[lower]
+        assert _rosters(league)[upper] != before[upper]
+        dynasty.run(5, seed=5)
+        assert dynasty.seasons == 6
+        assert len(dynasty.history) == 3
+        assert sum(dynasty.titles.values()) == 6
+        strengths = dynasty.strengths()
+        assert abs(sum(strengths.values()) - 100) < 1e-9
+        assert all(strength > 0 for strength in strengths.values())
+        other = Dynasty(same, window=3)
+        other.run(6, seed=5)
+        assert other.strengths() == strengths
+        assert _rosters(same) == _rosters(league)
+        assert os.path.getmtime(LEAGUE_FILE) == modified
+        league.destroy()
+        same.destroy()
+        # strengths of the file do not sum to 100, their shares stand for 10 of 11 seasons
+        league = load_league(LEAGUE_FILE, db_dirs[0])
+        total = sum(league.store.strength)
+        assert abs(total - 100) > 1
+        shares = {name: strength / total * 100 for name, strength in
+                  zip(league.store.names, league.store.strength)}
+        dynasty = Dynasty(league, window=11)
+        dynasty.run(1, seed=5)
+        season_points = sum(dynasty.points())
+        for team_id, name in enumerate(league.store.names):
+            expected = (shares[name] * 10 + dynasty.history[0][team_id] / season_points * 100) / 11
+            assert abs(dynasty.strengths()[name] - expected) < 1e-9
+            assert abs(dynasty.strengths()[name] - shares[name]) < 100 / 11
+        league.destroy()
+    finally:
+        for db_dir in db_dirs:
+            shutil.rmtree(db_dir)
+
+
+def _check_timeline(match):
+    goals = match.timeline()
+    assert [side for _, side in goals].count(0) == match.score.home
+    assert [side for _, side in goals].count(1) == match.score.away
+    assert goals == sorted(goals)
+    regular = sum(match.score.periods[0][2:])
+    assert all(1 <= minute <= 90 for minute, _ in goals[:regular])
+    assert all(91 <= minute <= 120 for minute, _ in goals[regular:])
+
+
+def test_timeline():
+    """Check goal minutes are drawn on request only, without losing any goal"""
+    # more goals than minutes
+    assert goal_timeline([(0, 1, 3, 2)]) == [(1, 0)] * 3 + [(1, 1)] * 2
+    league = _league()
+    for engine in (None, BatchEngine(2)):
+        league.reset()
+        league.engine = engine
+        matches = []
+        league.events.match_played = [lambda match, minutes: matches.append(match)]
+        league.initialize()
+        league.play()
+        assert all(match.timed_periods == 0 and not match.goals for match in matches)
+        for match in matches:
+            _check_timeline(match)
+            assert match.timeline() is match.goals
+    # extra time goals come after the regular time ones, drawn in batch
+    matches = []
+    for _ in range(20):
+        match = Match(Team("A"), Team("B"), distributions=league.distributions)
+        match.record_score((2, 1), 90)
+        match.record_score((1, 1), 30)
+        matches.append(match)
+    BatchEngine(3).timelines(matches)
+    for match in matches:
+        assert match.timed_periods == 2
+        assert len(match.goals) == 5
+        _check_timeline(match)
+    league.destroy()
+
+
+def test_league_cache():
+    """Check the parsed league file is cached until the file changes"""
+    work_dir = tempfile.mkdtemp()
+    try:
+        league_file = os.path.join(work_dir, "league.yaml")
+        shutil.copy(LEAGUE_FILE, league_file)
+        cache_file = league_file + LEAGUE_CACHE_SUFFIX
+        with open(league_file) as stream:
+            parsed = yaml.safe_load(stream)
+        assert read_league(league_file) == parsed
+        assert os.path.exists(cache_file)
+        assert read_league(league_file) == parsed
+        with open(league_file, "a") as stream:
+            stream.write("# changed\n")
+        assert read_league(league_file) == parsed
+        name = list(parsed)[0]
+        parsed[name]["playoffs"] = not parsed[name]["playoffs"]
+        with open(league_file, "w") as stream:
+            yaml.safe_dump(parsed, stream)
+        assert read_league(league_file) == parsed
+        with open(cache_file, "wb") as stream:
+            stream.write(b"garbage")
+        assert read_league(league_file) == parsed
+        league = load_league(league_file, work_dir, cache=False)
+        assert league.playoffs == parsed[name]["playoffs"]
+        league.destroy()
+    finally:
+        shutil.rmtree(work_dir)
+
+
+IMPORT_CHECK = """
+import sys, logging
+import ncl.ncl_lib
+print(",".join(name for name in ("yaml", "numpy", "sqlite3", "argparse", "concurrent.futures")
+               if name in sys.modules))
+print(len(logging.getLogger().handlers), logging.getLogger().level)
+"""
+
+
+def test_library_mode():
+    """Check importing and building leagues has no global side effect, import time is in
+    the benchmark report"""
+    root = os.path.join(os.path.dirname(__file__), "..", "..")
+    output = subprocess.run([sys.executable, "-c", IMPORT_CHECK], cwd=root, check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    modules, root_logger = output.splitlines()
+    assert modules == ""
+    assert root_logger == "0 {0}".format(logging.WARNING)
+    assert not [handler for handler in LOGGER.handlers
+                if not isinstance(handler, logging.NullHandler)]
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGPIPE)}
+    league = _league()
+    assert {signum: signal.getsignal(signum) for signum in handlers} == handlers
+    league.destroy()